@@ -3,47 +3,64 @@ Validation script for semantic assets.
 """
 
 import logging
+import os
+import sys
+from itertools import chain
 from multiprocessing import Pool
 from pathlib import Path
+from typing import Dict, List
 
 import click
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
+API_DIR = Path(__file__).parent.parent / "openapi"
+
+from dati_playground.validators import HOOKS, list_files, validate_file, validate_files
+from dati_playground.validators.cache import ValidationCache, default_cache_file
+
+
+def report_hooks(results: List[Dict[str, List[str]]]) -> int:
+    """Print the result of each hook, and its errors sorted by file.
+
+    :param results: the errors of each hook, for each file.
+    :returns: the exit code.
+    """
+    exit_code = 0
+    for hook in HOOKS:
+        hook_results = [r[hook] for r in results if hook in r]
+        errors = list(dict.fromkeys(chain.from_iterable(hook_results)))
+        if not hook_results:
+            print(f"{hook}: Skipped (no files to check)")
+            continue
+        print(
+            f"{hook}: {'Failed' if errors else 'Passed'} (files: {len(hook_results)})"
+        )
+        for error in errors:
+            print("ERROR: ", error)
+        exit_code = exit_code or int(bool(errors))
+    return exit_code
 
-from dati_playground.schema import build_schema
-from dati_playground.tools import (
-    build_semantic_asset,
-    build_vocabularies,
-    build_yaml_asset,
-)
-from dati_playground.validators import (
-    csv,
-    directory_versioning_pattern,
-    filename_format,
-    filename_match_directory,
-    filename_match_uri,
-    json_schema,
-    list_files,
-    mandatory_files_presence,
-    openapi,
-    repo_structure,
-    shacl,
-    turtle,
-    utf8_file_encoding,
-    validate_file,
-    versioned_directory,
-)
+
+def run_api_command(script: str, *args: str):
+    """Run one of the commands of the API in openapi/,
+    with the interpreter and the environment of this process."""
+    import subprocess
+
+    subprocess.run([sys.executable, script, *args], cwd=API_DIR, check=True)
 
 
 @click.command()
-@click.argument("command", type=(click.Choice(["validate", "build"])))
+@click.argument("command", type=(click.Choice(["validate", "build", "daemon"])))
 @click.argument("files", type=click.Path(exists=True), nargs=(-1))
 @click.option("--validate", default=False)
 @click.option("--build-semantic", default=False)
 @click.option("--build-json", default=False)
 @click.option("--build-schema-index", default=False)
 @click.option("--build-csv", default=False)
+@click.option("--build-api-snapshot", default=False)
+@click.option("--build-datastore-manifest", default=False)
+@click.option("--api-base-url", default="http://localhost:8080/vocabularies/v1")
 @click.option("--validate-shacl", default=False)
 @click.option("--validate-oas3", default=False)
 @click.option("--validate-jsonschema", default=False)
@@ -59,6 +76,51 @@ from dati_playground.validators import (
 @click.option("--validate-utf8-file-encoding", default=False)
 @click.option("--pattern", default="")
 @click.option("--exclude", default=["NoneString"], type=str, multiple=True)
+@click.option(
+    "--workers",
+    default=os.cpu_count(),
+    type=click.IntRange(min=1),
+    help="Number of processes validating the files.",
+)
+@click.option(
+    "--all",
+    "all_checks",
+    is_flag=True,
+    default=False,
+    help="Run all the pre-commit checks applying to each file, in one process.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Validate all files, ignoring the results of previous runs.",
+)
+@click.option(
+    "--compare-graphs",
+    is_flag=True,
+    default=False,
+    help="Turtle files in latest/ with the same triples as in the last version"
+    " directory pass --validate-versioned-directory, even if serialized differently.",
+)
+@click.option(
+    "--syntax-only",
+    is_flag=True,
+    default=False,
+    help="--validate-turtle only checks the syntax, reading the files"
+    " in chunks instead of parsing them in memory.",
+)
+@click.option(
+    "--no-daemon",
+    is_flag=True,
+    default=False,
+    help="Validate in this process, even if the validation daemon is running.",
+)
+@click.option(
+    "--idle-timeout",
+    default=900,
+    type=click.IntRange(min=1),
+    help="Seconds after which an idle daemon exits.",
+)
 @click.option("--debug", default=False, type=bool)
 def main(
     command,
@@ -67,6 +129,9 @@ def main(
     build_semantic,
     build_json,
     build_csv,
+    build_api_snapshot,
+    build_datastore_manifest,
+    api_base_url,
     validate_shacl,
     validate_oas3,
     validate_jsonschema,
@@ -83,11 +148,31 @@ def main(
     pattern,
     exclude,
     build_schema_index,
+    workers,
+    all_checks,
+    no_cache,
+    compare_graphs,
+    syntax_only,
+    no_daemon,
+    idle_timeout,
     debug,
 ):
     if debug:
         logging.basicConfig(level=logging.DEBUG)
+    if command == "daemon":
+        from dati_playground.daemon import serve
+
+        serve(idle_timeout=idle_timeout)
+        exit(0)
     if command == "build":
+        # Building depends on pandas and pyld: only import them when needed.
+        from dati_playground.schema import build_schema
+        from dati_playground.tools import (
+            build_semantic_asset,
+            build_vocabularies,
+            build_yaml_asset,
+        )
+
         basepath = Path("assets") if not files else Path(files[0])
         buildpath = Path("_build") if len(files) < 2 else Path(files[1])
         buildpath.mkdir(exist_ok=True, parents=True)
@@ -100,76 +185,112 @@ def main(
         ]
 
         log.warning(f"Examining {file_list} with {exclude}")
-        workers = Pool(processes=4)
+        pool = Pool(processes=workers)
         if validate:
-            workers.map(validate_file, file_list)
+            pool.map(validate_file, file_list)
         if build_semantic:
-            workers.starmap(
+            pool.starmap(
                 build_semantic_asset,
                 ((f, buildpath) for f in file_list if f.suffix == ".ttl"),
             )
         if build_csv:
-            workers.starmap(
+            pool.starmap(
                 build_vocabularies,
                 ((f, buildpath) for f in file_list if f.suffix == ".ttl"),
             )
         if build_json:
-            workers.starmap(
+            pool.starmap(
                 build_yaml_asset,
                 ((f, buildpath) for f in file_list if f.suffix == ".yaml"),
             )
         if build_schema_index:
-            workers.starmap(
+            pool.starmap(
                 build_schema,
                 ((f, buildpath) for f in file_list if f.name.endswith((".oas3.yaml",))),
             )
-            workers.starmap(
+            pool.starmap(
                 build_schema,
                 ((f, Path(".")) for f in file_list if f.name.endswith((".oas3.yaml",))),
             )
 
-        workers.close()
+        pool.close()
+
+        # The API is not part of this package, and its modules import each other
+        #  as top-level modules: run their own commands from its directory.
+        dbfile = (buildpath / "datastore.db").absolute()
+        if build_csv and dbfile.exists():
+            # Indexed once, as the tables are written by many processes.
+            run_api_command("datasync.py", "index", dbfile.as_posix())
+        if build_datastore_manifest:
+            run_api_command("datasync.py", "publish", dbfile.as_posix())
+        if build_api_snapshot:
+            run_api_command(
+                "snapshot.py",
+                dbfile.as_posix(),
+                (buildpath / "api").absolute().as_posix(),
+                "--base-url",
+                api_base_url,
+            )
         exit(0)
     else:
         log.debug(files)
-        errors = []
         if command == "validate":
-            for f in files:
-                f = Path(f)
-                if validate_shacl:
-                    shacl.validate(f, errors)
-                if validate_oas3:
-                    openapi.validate(f, errors)
-                if validate_jsonschema:
-                    json_schema.validate(f, errors)
-                if validate_versioned_directory:
-                    versioned_directory.validate(f, errors)
-                if validate_turtle:
-                    turtle.validate(f, errors)
-                if validate_csv:
-                    csv.validate(f, errors)
-                if validate_repo_structure:
-                    repo_structure.validate(f, errors)
-                if validate_filename_format:
-                    filename_format.validate(f, errors)
-                if validate_filename_match_uri:
-                    filename_match_uri.validate(f, errors)
-                if validate_filename_match_directory:
-                    filename_match_directory.validate(f, errors)
-                if validate_directory_versioning_pattern:
-                    directory_versioning_pattern.validate(f, errors)
-                if validate_mandatory_files_presence:
-                    mandatory_files_presence.validate(f, errors)
-                if validate_utf8_file_encoding:
-                    utf8_file_encoding.validate(f, errors)
+            validators = [
+                validator
+                for enabled, validator in (
+                    (validate_shacl, "shacl"),
+                    (validate_oas3, "openapi"),
+                    (validate_jsonschema, "json_schema"),
+                    (
+                        validate_versioned_directory,
+                        (
+                            "versioned_directory:validate_graphs"
+                            if compare_graphs
+                            else "versioned_directory"
+                        ),
+                    ),
+                    (
+                        validate_turtle,
+                        "turtle:validate_syntax" if syntax_only else "turtle",
+                    ),
+                    (validate_csv, "csv"),
+                    (validate_repo_structure, "repo_structure"),
+                    (validate_filename_format, "filename_format"),
+                    (validate_filename_match_uri, "filename_match_uri"),
+                    (validate_filename_match_directory, "filename_match_directory"),
+                    (
+                        validate_directory_versioning_pattern,
+                        "directory_versioning_pattern",
+                    ),
+                    (validate_mandatory_files_presence, "mandatory_files_presence"),
+                    (validate_utf8_file_encoding, "utf8_file_encoding"),
+                )
+                if enabled
+            ]
+            if all_checks:
+                validators = None
+            files = sorted(set(files))
+            cache_file = None if no_cache else default_cache_file()
+            results = None
+            if not no_daemon:
+                # Forward the validation to the daemon, if it is running.
+                from dati_playground.daemon import forward
+
+                results = forward(files, validators, cache_file, workers=workers)
+            if results is None:
+                cache = ValidationCache(cache_file) if cache_file else None
+                results = validate_files(files, validators, cache, workers)
+
+            if all_checks:
+                exit(report_hooks(results))
 
+            # Errors are sorted by file, and errors shared
+            #  by many files are reported once.
+            errors = list(dict.fromkeys(chain.from_iterable(results)))
             if errors:
-                errors = list(set(errors))
                 for error in errors:
                     print("ERROR: ", error)
                 exit(1)
-            else:
-                pass
 
 
 if __name__ == "__main__":
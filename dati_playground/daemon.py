@@ -0,0 +1,217 @@
+"""
+Validation daemon.
+
+`python -m dati_playground daemon` keeps the validators imported
+and their artifacts in memory, eg. the shapes graphs of the rules.shacl
+and the parsed Turtle files, and serves validation requests
+on a Unix socket.
+When the daemon is running, `python -m dati_playground validate`
+forwards its files to it instead of validating them,
+so that each run does not import and parse everything again.
+
+Artifacts are reused while the hash of their file does not change.
+The daemon exits after `idle_timeout` seconds without requests.
+
+The protocol is one JSON request and one JSON response per connection,
+each on a single line.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from dati_playground.validators import HOOKS, get_validator, validate_files
+from dati_playground.validators.cache import ValidationCache, default_cache_file
+from dati_playground.validators.context import ValidationContext
+
+log = logging.getLogger(__name__)
+
+SOCKET_ENV = "DATI_VALIDATION_SOCKET"
+IDLE_TIMEOUT = 900
+MAX_GRAPHS = 256
+CONNECT_TIMEOUT = 1
+
+
+def default_socket_path() -> Path:
+    if SOCKET_ENV in os.environ:
+        return Path(os.environ[SOCKET_ENV])
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "dati_playground" / "validation.sock"
+    return default_cache_file().parent / "validation.sock"
+
+
+@lru_cache(maxsize=None)
+def source_version() -> str:
+    """Return a hash of the sources of the package, so that
+    a client never uses a daemon running another version."""
+    digest = hashlib.sha256()
+    for fpath in sorted(Path(__file__).parent.rglob("*.py")):
+        digest.update(fpath.read_bytes())
+    return digest.hexdigest()
+
+
+class GraphCache(OrderedDict):
+    """The parsed graphs, discarding the least recently used ones."""
+
+    def __init__(self, maxsize: int = MAX_GRAPHS):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        self.move_to_end(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class ValidationRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = self.server.validate(json.loads(self.rfile.readline()))
+        except Exception as e:
+            log.exception("Cannot process the validation request.")
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class ValidationServer(socketserver.UnixStreamServer):
+    """Serve one request at a time: validators share process-wide artifacts,
+    and the request runs in the working directory of the client."""
+
+    def __init__(self, socket_path: Path, idle_timeout: int = IDLE_TIMEOUT):
+        super().__init__(Path(socket_path).as_posix(), ValidationRequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.timeout = idle_timeout
+        self.idle = False
+
+    def handle_timeout(self):
+        log.info("Exiting after %s idle seconds.", self.timeout)
+        self.idle = True
+
+    def validate(self, request: dict) -> dict:
+        if request.get("version") != source_version():
+            return {"error": "The daemon runs another version of dati_playground."}
+        cache_file = request.get("cache_file")
+        cache = ValidationCache(cache_file) if cache_file else None
+        cwd = os.getcwd()
+        # Validators check the paths relative to the repository root.
+        os.chdir(request["cwd"])
+        try:
+            # The graphs parsed by the worker processes are not kept.
+            results = validate_files(
+                request["files"],
+                request["validators"],
+                cache,
+                request.get("workers", 1),
+            )
+        finally:
+            os.chdir(cwd)
+        return {"results": results}
+
+
+def serve(socket_path: Path = None, idle_timeout: int = IDLE_TIMEOUT):
+    """Serve validation requests until the daemon is idle for `idle_timeout` seconds.
+
+    :raises RuntimeError: if another daemon is listening on `socket_path`.
+    """
+    socket_path = Path(socket_path or default_socket_path())
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if socket_path.exists():
+        sock = connect(socket_path)
+        if sock:
+            sock.close()
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        # Left by a daemon that did not exit cleanly.
+        socket_path.unlink()
+
+    # Warm up the validators and share the parsed graphs among requests.
+    for name, _, _ in HOOKS.values():
+        get_validator(name)
+    get_validator("turtle")
+    ValidationContext.graphs = GraphCache()
+
+    server = ValidationServer(socket_path, idle_timeout)
+    if threading.current_thread() is threading.main_thread():
+        # Remove the socket when killed.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    log.info(f"Listening on {socket_path}")
+    try:
+        while not server.idle:
+            server.handle_request()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+def connect(socket_path: Path) -> Optional[socket.socket]:
+    """Return a connection to the daemon, or None if it is not running."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(Path(socket_path).as_posix())
+    except OSError:
+        sock.close()
+        return None
+    # Validating may take long.
+    sock.settimeout(None)
+    return sock
+
+
+def forward(
+    files: List[str],
+    validators: Optional[List[str]],
+    cache_file: Optional[Path],
+    socket_path: Path = None,
+    workers: int = 1,
+) -> Optional[list]:
+    """Validate the files with the daemon, if it is running,
+    in `workers` processes as validate_files does.
+
+    :returns: the results of validate_files, or None
+        if the files must be validated by the caller.
+    """
+    socket_path = Path(socket_path or default_socket_path())
+    if not socket_path.exists():
+        return None
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+
+    request = {
+        "version": source_version(),
+        "cwd": os.getcwd(),
+        "files": list(files),
+        "validators": validators,
+        "cache_file": cache_file and Path(cache_file).as_posix(),
+        "workers": workers,
+    }
+    try:
+        with sock, sock.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            response = json.loads(stream.readline() or "{}")
+    except (OSError, ValueError) as e:
+        log.warning(f"Validating without the daemon on {socket_path}: {e}")
+        return None
+    if "results" not in response:
+        log.warning(
+            f"Validating without the daemon on {socket_path}: {response.get('error')}"
+        )
+        return None
+    log.debug(f"Validated {len(files)} files with the daemon on {socket_path}")
+    return response["results"]
@@ -1,13 +1,24 @@
 import json
 import logging
+from collections import defaultdict
+from itertools import chain
 from pathlib import Path
 from typing import Dict
 
 import pandas as pd
 from pyld import jsonld
+from rdflib import Graph
+from rdflib.namespace import SKOS
 from rdflib.plugins.serializers.jsonld import from_rdf
 
-from .utils import MIME_TURTLE, is_recent_than, parse_graph, yaml_load, yaml_safe_dump
+from .utils import (
+    MIME_TURTLE,
+    is_recent_than,
+    parse_graph,
+    version_key,
+    yaml_load,
+    yaml_safe_dump,
+)
 from .validators import is_framing_context
 
 log = logging.getLogger(__name__)
@@ -130,6 +141,10 @@ def frame_vocabulary_to_csv(
 
     datastore = dest_dir / "datastore.db"
     if dump_sqlite:
+        closure = None
+        if "url" in df.columns:
+            g = parse_graph(vpath.as_posix(), format=MIME_TURTLE)
+            closure = hierarchy_closure(g, dict(zip(df["url"], df.index)))
         df_to_sqlite(
             df,
             datastore,
@@ -138,6 +153,7 @@ def frame_vocabulary_to_csv(
             description=csv_metadata["description"],
             url=csv_metadata["url"],
             context=context["@context"],
+            closure=closure,
         )
     # Save json-schema version
     dpath = (dest_dir / vpath).with_suffix(context_prefix + ".oas3.yaml")
@@ -183,6 +199,37 @@ def df_to_schema(df) -> Dict:
     }
 
 
+def hierarchy_closure(g: Graph, keys: Dict[str, str]) -> pd.DataFrame:
+    """
+    Returns the transitive closure of the skos:broader/skos:narrower
+    hierarchy between the concepts in `keys`.
+
+    @param: g - the vocabulary graph
+    @param: keys - a {url: key} dict of the vocabulary entries
+    @returns: a DataFrame of (ancestor, descendant, depth) keys,
+        where depth is the length of the shortest path.
+    """
+    parents = defaultdict(set)
+    edges = chain(
+        g.subject_objects(SKOS.broader),
+        ((child, parent) for parent, child in g.subject_objects(SKOS.narrower)),
+    )
+    for child, parent in edges:
+        child, parent = keys.get(str(child)), keys.get(str(parent))
+        if child is not None and parent is not None and child != parent:
+            parents[child].add(parent)
+
+    rows = []
+    for descendant in parents:
+        depth, ancestors, seen = 0, {descendant}, {descendant}
+        while ancestors:
+            depth += 1
+            ancestors = {p for a in ancestors for p in parents.get(a, ())} - seen
+            seen |= ancestors
+            rows += [(a, descendant, depth) for a in sorted(ancestors)]
+    return pd.DataFrame(rows, columns=["ancestor", "descendant", "depth"])
+
+
 def df_to_sqlite(
     df,
     dpath: Path,
@@ -192,6 +239,7 @@ def df_to_sqlite(
     description: str = None,
     context: Dict = None,
     url: str = None,
+    closure: pd.DataFrame = None,
 ):
     from pandas.core.frame import DataFrame
     from sqlalchemy import create_engine
@@ -209,8 +257,24 @@ def df_to_sqlite(
             "title": title or name,
             "description": description or name,
             "version": version,
+            "version_key": version_key(version),
             "context": json.dumps(context or {}),
             "url": url,
         },
         index=[0],
     ).to_sql(f"{table_name}#meta", con=engine, if_exists="replace")
+
+    closure_table = f"{table_name}#closure"
+    if closure is None or closure.empty:
+        # Do not leave the closure of a previous build of this version.
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{closure_table}"')
+        return
+    log.info(f"Dumping hierarchy closure of {table_name}")
+    closure.to_sql(closure_table, con=engine, if_exists="replace", index=False)
+    with engine.begin() as conn:
+        for column in ("ancestor", "descendant"):
+            conn.exec_driver_sql(
+                f"""CREATE INDEX "ix_{closure_table}_{column}"
+                ON "{closure_table}" ({column}, depth)"""
+            )
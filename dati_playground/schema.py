@@ -5,7 +5,6 @@ from pathlib import Path
 from typing import Dict
 
 import jsonpath_ng
-import requests_cache
 from pyld import jsonld
 from rdflib import DCAT, DCTERMS, OWL, RDF, RDFS, Graph, Literal, URIRef
 from rdflib.namespace import Namespace
@@ -13,8 +12,6 @@ from requests import get
 
 from .utils import is_recent_than, load_all_assets, yaml_load
 
-requests_cache.install_cache("oas3_to_turtle")
-
 log = logging.getLogger(__name__)
 
 NS_ADMSAPT = Namespace("https://www.w3.org/italia/onto/ADMS/")
@@ -88,6 +85,18 @@ class Asset:
         )
 
 
+@lru_cache(maxsize=None)
+def install_http_cache():
+    """Cache the remote assets and JSON-LD contexts on disk.
+
+    The cache is installed process-wide, so it is only installed
+    before the first download instead of when this module is imported.
+    """
+    import requests_cache
+
+    requests_cache.install_cache("oas3_to_turtle")
+
+
 @lru_cache(maxsize=100)
 def get_asset(uri):
     log.debug(f"Loading asset for <{uri}>.")
@@ -101,6 +110,7 @@ def get_asset(uri):
         return g
 
     log.info("Loading stuff from ontopia.")
+    install_http_cache()
     netloc = uri.replace(
         "https://w3id.org/italia/", "https://ontopia-lodview.agid.gov.it/"
     )
@@ -168,6 +178,7 @@ def get_semantic_references_from_oas3(schema: Dict):
 
 def get_schema_assets(context: Dict) -> Graph:
 
+    install_http_cache()
     g = Graph()
     log.debug("Normalizing %r", context)
     try:
@@ -1,5 +1,6 @@
 import json
 import logging
+import re
 from functools import lru_cache
 from pathlib import Path
 
@@ -66,3 +67,14 @@ RDFDumper.add_representer(URIRef, RDFDumper.represent_uri)
 
 def yaml_safe_dump(*args, **kwargs):
     return yaml.dump(*args, Dumper=RDFDumper, **kwargs)
+
+
+def version_key(version: str) -> str:
+    """Return a string whose lexicographic order
+    matches the numeric order of `version`,
+    zero-padding every group of digits, eg.
+
+    >>> version_key("1.10.0") > version_key("1.9.0")
+    True
+    """
+    return re.sub(r"\d+", lambda m: m.group().zfill(16), version)
@@ -1,23 +1,45 @@
+"""
+Validators of the semantic assets.
+
+Each validator is a module with a `validate(fpath, errors, context)` function.
+Validators depend on heavy libraries, eg. pyshacl or frictionless,
+so they are referenced by module name and imported on first use
+with `get_validator`: the CLI only imports the ones it runs.
+"""
+
 import logging
 import os
+import re
+from functools import partial
+from importlib import import_module
+from itertools import chain, islice
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
 
-import jsonschema
 import yaml
-from rdflib import Graph
 
-import dati_playground.validators.json_schema as json_schema
-import dati_playground.validators.openapi as openapi
-import dati_playground.validators.turtle as turtle
+from dati_playground.validators.cache import ValidationCache
+from dati_playground.validators.context import ValidationContext
+from dati_playground.validators.tree import TreeSnapshot
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-from dati_playground.utils import MIME_JSONLD, yaml_to_json
+
+def get_validator(name: str) -> Callable:
+    """Return the `validate` function of the validator module `name`,
+    eg. "shacl", or another function given as "module:function",
+    eg. "versioned_directory:validate_graphs", importing it on first use."""
+    module, _, function = name.partition(":")
+    return getattr(import_module(f"{__name__}.{module}"), function or "validate")
 
 
 def is_jsonld(content: str):
+    from rdflib import Graph
+
+    from dati_playground.utils import MIME_JSONLD, yaml_to_json
+
     content = yaml_to_json(content)
     g = Graph()
     g.parse(data=content, format=MIME_JSONLD)
@@ -45,6 +67,8 @@ def is_framing_context(content: str):
             },
         },
     }
+    import jsonschema
+
     jsonschema.validate(data, framing_context_schema)
     return True
 
@@ -56,12 +80,17 @@ def is_valid_sqlite(datafile: Path, schema: Dict) -> bool:
     raise NotImplementedError
 
 
+# Checked while reading the file, so their size is not capped.
+STREAMED_SUFFIXES = {
+    "*.ttl": "turtle:check_syntax",
+    "*.shacl": "turtle:check_syntax",
+}
+
+# Validator modules are given by name, see get_validator.
 VALID_SUFFIXES = {
-    "*.ttl": turtle.validate,
-    "*.shacl": turtle.validate,
     "*.ld.yaml": is_jsonld,
-    "*.oas3.yaml": openapi.validate,
-    "*.schema.yaml": json_schema.validate,
+    "*.oas3.yaml": "openapi",
+    "*.schema.yaml": "json_schema",
     "context-*.ld.yaml": is_framing_context,
 }
 
@@ -80,12 +109,20 @@ SKIP_SUFFIXES = (
 
 def validate_file(f: str):
     f = Path(f).absolute()
+    for file_pattern, check in STREAMED_SUFFIXES.items():
+        if Path(f.name).match(file_pattern):
+            print(f"Validating {f}")
+            get_validator(check)(f)
+            return True
+
     f_size = f.stat().st_size
     if f_size > 4 << 20:
         raise ValueError(f"File too big: {f_size}")
 
     for file_pattern, is_valid in VALID_SUFFIXES.items():
         if Path(f.name).match(file_pattern):
+            if isinstance(is_valid, str):
+                is_valid = get_validator(is_valid)
             print(f"Validating {f}")
             if is_valid(f.read_text()):
                 return True
@@ -94,6 +131,199 @@ def validate_file(f: str):
     raise ValueError(f"Unsupported file {f}")
 
 
+def run_validator(
+    validate: Callable,
+    fpath: Path,
+    errors: list,
+    context: ValidationContext,
+    cache: ValidationCache = None,
+):
+    """Run a `validate(fpath, errors, context)` function,
+    unless it already succeeded on the same content
+    and a `cache` is given."""
+    key = None
+    if cache:
+        try:
+            key = cache.key(validate, fpath, context)
+        except OSError as e:
+            log.debug(f"Cannot cache the validation of {fpath}: {e}")
+    if key and key in cache:
+        log.debug(f"Skipping {validate.__module__} on {fpath}: cached.")
+        return
+    previous_errors = len(errors)
+    validate(fpath, errors, context)
+    if key and len(errors) == previous_errors:
+        cache.add(key, validate, fpath)
+
+
+def validate_path(
+    fpath: Path,
+    validators: List[Callable],
+    cache: ValidationCache = None,
+    tree: TreeSnapshot = None,
+) -> List[str]:
+    """Run the `validate(fpath, errors, context)` functions of the
+    given validators on a file, sharing its ValidationContext.
+
+    Files validated with the same `tree` share its directory listings.
+
+    Validations that already succeeded on the same content
+    are skipped when a `cache` is given.
+
+    This is a module-level function so that it can be
+    dispatched to the processes of a Pool.
+
+    :returns: the errors, without duplicates.
+    """
+    fpath = Path(fpath)
+    context = ValidationContext(fpath, tree)
+    errors = []
+    for validate in validators:
+        run_validator(validate, fpath, errors, context, cache)
+    return list(dict.fromkeys(errors))
+
+
+# The validators of the checks of .pre-commit-hooks.yaml,
+#  with the `files` and `exclude` patterns of their hooks.
+#  Keep them in sync with the hooks definitions.
+HOOKS = {
+    "validate-turtle": (
+        "shacl",
+        r"^assets/.*\.ttl$",
+        r".*(-aligns|-DBGT|example).*",
+    ),
+    "validate-oas-schema": ("json_schema", r"^assets/.*\.schema.yaml", r".*example.*"),
+    "validate-openapi-schema": ("openapi", r"^assets/.*\.oas3.yaml", r".*example.*"),
+    "validate-directory-versioning": (
+        "versioned_directory",
+        r"^assets/.*\.ttl",
+        r".*(-aligns|-DBGT|example).*",
+    ),
+    "validate-csv": ("csv", r"^assets/vocabularies/.*\.csv", None),
+    "validate-repo-structure": ("repo_structure", r"^assets\/.*", None),
+    "validate-filename-format": ("filename_format", r"^assets\/.*", None),
+    "validate-filename-match-uri": ("filename_match_uri", r"^assets\/.*\.ttl", None),
+    "validate-filename-match-directory": (
+        "filename_match_directory",
+        r"^assets\/.*",
+        r".*example.*",
+    ),
+    "validate-directory-versioning-pattern": (
+        "directory_versioning_pattern",
+        r"^assets\/.*\.ttl",
+        None,
+    ),
+    "validate-mandatory-files-presence": (
+        "mandatory_files_presence",
+        r"^assets\/.*",
+        None,
+    ),
+    "validate-utf8-file-encoding": ("utf8_file_encoding", r"^assets\/.*", None),
+}
+
+
+def applicable_hooks(fpath: Path) -> List[str]:
+    """Return the hooks whose patterns match `fpath`,
+    matched like pre-commit does on the path relative to
+    the current directory, ie. the repository root."""
+    relpath = Path(os.path.relpath(fpath)).as_posix()
+    return [
+        hook
+        for hook, (_, files, exclude) in HOOKS.items()
+        if re.search(files, relpath) and not (exclude and re.search(exclude, relpath))
+    ]
+
+
+def validate_hooks(
+    fpath: Path, cache: ValidationCache = None, tree: TreeSnapshot = None
+) -> Dict[str, List[str]]:
+    """Run all the hooks applying to a file, sharing its ValidationContext.
+
+    :returns: the errors of each hook, without duplicates.
+    """
+    fpath = Path(fpath)
+    context = ValidationContext(fpath, tree)
+    results = {}
+    for hook in applicable_hooks(fpath):
+        errors = []
+        run_validator(get_validator(HOOKS[hook][0]), fpath, errors, context, cache)
+        results[hook] = list(dict.fromkeys(errors))
+    return results
+
+
+def validate_batch(
+    fpaths: Sequence[Path], validators: List[Callable], cache: ValidationCache = None
+) -> List[List[str]]:
+    """Validate a batch of files in the same process,
+    so that they share the artifacts cached per process,
+    eg. the shapes graph of their rules.shacl,
+    and a snapshot of the directory tree.
+
+    :returns: the errors of each file, in the order of `fpaths`.
+    """
+    tree = TreeSnapshot()
+    return [validate_path(fpath, validators, cache, tree) for fpath in fpaths]
+
+
+def validate_hooks_batch(
+    fpaths: Sequence[Path], cache: ValidationCache = None
+) -> List[Dict[str, List[str]]]:
+    """Like validate_batch, running the hooks applying to each file.
+
+    :returns: the errors of each hook, for each file in the order of `fpaths`.
+    """
+    tree = TreeSnapshot()
+    return [validate_hooks(fpath, cache, tree) for fpath in fpaths]
+
+
+def validate_files(
+    files: Sequence[str],
+    validators: Optional[List[str]],
+    cache: ValidationCache = None,
+    workers: int = 1,
+) -> list:
+    """Validate the files in batches, dispatched to `workers` processes.
+
+    Files sharing a rules.shacl are validated in the same batches,
+    so that each process builds its shapes graph once.
+
+    :param validators: the names of the validator modules,
+        or None to run all the hooks applying to each file.
+    :returns: the result of each file, in the order of `files`:
+        its errors, or the errors of each hook if `validators` is None.
+    """
+    if validators is None:
+        run = partial(validate_hooks_batch, cache=cache)
+    else:
+        run = partial(
+            validate_batch,
+            validators=[get_validator(name) for name in validators],
+            cache=cache,
+        )
+    workers = min(workers, len(files))
+    groups = {None: list(files)}
+    if validators is None or "shacl" in validators:
+        groups = import_module(f"{__name__}.shacl").group_by_rules(files)
+    batches = batched(groups.values(), max(1, len(files) // (4 * max(workers, 1))))
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            results = pool.map(run, batches, chunksize=1)
+    else:
+        results = [run(batch) for batch in batches]
+    file_results = dict(zip(chain.from_iterable(batches), chain.from_iterable(results)))
+    return [file_results[f] for f in files]
+
+
+def batched(groups: Iterable[Sequence], size: int) -> List[Sequence]:
+    """Split each group in batches of at most `size` items,
+    so that a batch never mixes items of different groups."""
+    return [
+        list(islice(group, start, start + size))
+        for group in groups
+        for start in range(0, len(group), size)
+    ]
+
+
 def list_files(basepath):
     for root, dirs, files in os.walk(basepath):
         for f in files:
@@ -0,0 +1,121 @@
+"""
+On-disk cache of the successful validations.
+
+A validation is skipped when the same validator, in the same version,
+already succeeded on a file with the same content and dependencies,
+eg. the `rules.shacl` applying to the file.
+
+Only validators declaring `CACHEABLE = True` are cached:
+their result must only depend on the content of the file
+and of the files returned by their optional `dependencies(fpath)` function.
+Validators inspecting the file path or the repository layout always run.
+
+The cache is a SQLite database in WAL mode,
+so it can be shared by many processes.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import time
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Callable, Optional
+
+from dati_playground.validators.context import ValidationContext, file_hash
+
+log = logging.getLogger(__name__)
+
+CACHE_FILE_ENV = "DATI_VALIDATION_CACHE"
+TOOL_DISTRIBUTIONS = (
+    "dati_playground",
+    "rdflib",
+    "pyshacl",
+    "PyYAML",
+    "jsonschema",
+    "openapi-spec-validator",
+)
+
+
+def default_cache_file() -> Path:
+    if CACHE_FILE_ENV in os.environ:
+        return Path(os.environ[CACHE_FILE_ENV])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "dati_playground" / "validation.sqlite"
+
+
+@lru_cache(maxsize=None)
+def tool_version(module_name: str) -> str:
+    """Return a hash of the validator source and of the versions
+    of the libraries it uses, so that upgrading any of them
+    invalidates the cached results."""
+    digest = hashlib.sha256()
+    for name in (module_name, __name__, ValidationContext.__module__):
+        digest.update(Path(sys.modules[name].__file__).read_bytes())
+    for distribution in TOOL_DISTRIBUTIONS:
+        try:
+            digest.update(f"{distribution}=={version(distribution)}".encode())
+        except PackageNotFoundError:
+            continue
+    return digest.hexdigest()
+
+
+class ValidationCache:
+    def __init__(self, cache_file: Path):
+        self.cache_file = Path(cache_file)
+        self._db = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Connections cannot be shared with the processes of a Pool.
+        return {"cache_file": self.cache_file, "_db": None, "_pid": None}
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None or self._pid != os.getpid():
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.cache_file, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS validations (
+                key TEXT PRIMARY KEY, validator TEXT, path TEXT, created REAL)"""
+            )
+            self._pid = os.getpid()
+        return self._db
+
+    @staticmethod
+    def key(
+        validate: Callable, fpath: Path, context: ValidationContext
+    ) -> Optional[str]:
+        """Return the cache key of a validation,
+        or None if the validator is not cacheable."""
+        module = sys.modules[validate.__module__]
+        if not getattr(module, "CACHEABLE", False):
+            return None
+        digest = hashlib.sha256()
+        # Validators of the same module may check different things,
+        #  eg. turtle.validate and turtle.validate_syntax.
+        digest.update(f"{validate.__module__}.{validate.__qualname__}".encode())
+        digest.update(tool_version(validate.__module__).encode())
+        # Streamed validators never read the whole file in memory.
+        digest.update(context.digest.encode())
+        for dependency in getattr(module, "dependencies", lambda _: [])(fpath):
+            digest.update(file_hash(dependency).encode())
+        return digest.hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return bool(
+            self.db.execute(
+                "SELECT 1 FROM validations WHERE key = ?", (key,)
+            ).fetchone()
+        )
+
+    def add(self, key: str, validate: Callable, fpath: Path):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO validations VALUES (?, ?, ?, ?)",
+                (key, validate.__module__, Path(fpath).as_posix(), time.time()),
+            )
@@ -0,0 +1,117 @@
+"""
+Artifacts of a file shared by all the validators.
+
+Validators of the same file receive the same ValidationContext,
+so that the file is read, decoded and parsed at most once
+however many validators are run.
+
+Validators of the files of the same batch share
+the TreeSnapshot listing the repository directories.
+"""
+
+import hashlib
+import logging
+from functools import wraps
+from pathlib import Path
+from typing import TYPE_CHECKING, MutableMapping, Optional
+
+import yaml
+
+from dati_playground.validators.tree import TreeSnapshot
+
+if TYPE_CHECKING:
+    from rdflib import Graph
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_hash(fpath: Path) -> str:
+    """Return the sha256 of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with Path(fpath).open("rb") as fh:
+        while chunk := fh.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact(method):
+    """Compute an artifact on first access and store it.
+
+    Errors are stored too, and raised again on
+    every access without recomputing the artifact.
+    """
+    name = method.__name__
+
+    @property
+    @wraps(method)
+    def wrapper(self):
+        if name not in self._artifacts:
+            try:
+                self._artifacts[name] = (method(self), None)
+            except Exception as e:
+                self._artifacts[name] = (None, e)
+        value, error = self._artifacts[name]
+        if error is not None:
+            raise error
+        return value
+
+    return wrapper
+
+
+class ValidationContext:
+    # Parsed graphs shared by all the contexts, by content hash and URI,
+    #  eg. by the validation daemon. Validators must not modify them.
+    graphs: Optional[MutableMapping] = None
+
+    def __init__(self, fpath: Path, tree: TreeSnapshot = None):
+        self.fpath = Path(fpath)
+        self.tree = tree or TreeSnapshot()
+        self._artifacts = {}
+
+    @artifact
+    def content(self) -> bytes:
+        log.debug(f"Reading {self.fpath}")
+        return self.fpath.read_bytes()
+
+    @artifact
+    def digest(self) -> str:
+        """The sha256 of the content: the file is only read in memory
+        to compute it if it already was, eg. by another validator."""
+        content, _ = self._artifacts.get("content", (None, None))
+        if content is not None:
+            return hashlib.sha256(content).hexdigest()
+        return file_hash(self.fpath)
+
+    @artifact
+    def text(self) -> str:
+        """The UTF-8 content with universal newlines, like Path.read_text()."""
+        return self.content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+    @artifact
+    def graph(self) -> "Graph":
+        """The Turtle graph, with relative URIs resolved against the file path."""
+        # rdflib is only imported by the validators parsing the file.
+        from rdflib import Graph
+
+        from dati_playground.utils import MIME_TURTLE
+
+        public_id = self.fpath.absolute().as_uri()
+        key = None
+        if self.graphs is not None:
+            key = (self.digest, public_id)
+            if key in self.graphs:
+                log.debug(f"Reusing the graph of {self.fpath}")
+                return self.graphs[key]
+
+        log.debug(f"Parsing {self.fpath}")
+        g = Graph()
+        g.parse(data=self.text, format=MIME_TURTLE, publicID=public_id)
+        if key:
+            self.graphs[key] = g
+        return g
+
+    @artifact
+    def yaml(self):
+        return yaml.safe_load(self.text)
@@ -6,20 +6,29 @@ import json
 import logging
 import re
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
+
+from dati_playground.validators.context import ValidationContext
 
 log = logging.getLogger(__name__)
 
 RE_FIELD = re.compile("^[a-zA-Z0-9_]{2,64}$")
+# Results only depend on the file and on its datapackage.
+CACHEABLE = True
 from frictionless import Package, Resource
 from frictionless import validate as frictionless_validate
 
 
-def _get_resource(fpath) -> Tuple[Package, Resource]:
+def dependencies(fpath: Path) -> List[Path]:
+    """Return the datapackages that may describe `fpath`."""
     datapackage_candidates = (
         fpath.parent / f"datapackage.{ext}" for ext in ["json", "yaml", "yml"]
     )
-    for datapackage in (d for d in datapackage_candidates if d.exists()):
+    return [d for d in datapackage_candidates if d.exists()]
+
+
+def _get_resource(fpath) -> Tuple[Package, Resource]:
+    for datapackage in dependencies(fpath):
         package = Package(datapackage)
         log.debug(f"Found {datapackage} in {fpath.parent}")
         for r in package.resources:
@@ -30,7 +39,7 @@ def _get_resource(fpath) -> Tuple[Package, Resource]:
     return None, Resource(fpath)
 
 
-def validate(fpath: Path, errors: list):
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
     """Expose validation results from frictionless.
 
     If you need to use the validation results, you can
@@ -1,6 +1,10 @@
 import logging
 import re
 from pathlib import Path
+from typing import List
+
+from dati_playground.validators.context import ValidationContext
+from dati_playground.validators.tree import TreeSnapshot
 
 log = logging.getLogger(__name__)
 
@@ -10,29 +14,18 @@ DIR_PATTERN = (
 )
 
 
-def is_leaf_directory(directory: Path) -> bool:
+def is_leaf_directory(directory: Path, tree: TreeSnapshot = None) -> bool:
     """
     Checks if the directory does not contain any subdirectories.
     """
-    for subdir in directory.iterdir():
-        if subdir.is_dir():
-            return False
-    return True
+    return (tree or TreeSnapshot()).is_leaf(directory)
 
 
-def sibling_directories(directory: Path) -> list:
+def sibling_directories(directory: Path, tree: TreeSnapshot = None) -> list:
     """
     Retrieves a list of sibling directories at the same level as the specified directory.
     """
-    parent_directory = directory.parent
-
-    # all subdir
-    subdirectories = []
-    for subdir in parent_directory.iterdir():
-        if subdir.is_dir():
-            subdirectories.append(subdir)
-
-    return subdirectories
+    return (tree or TreeSnapshot()).siblings(directory)
 
 
 def is_versioned_directory(directory: Path) -> bool:
@@ -42,24 +35,22 @@ def is_versioned_directory(directory: Path) -> bool:
     return bool(re.match(DIR_PATTERN, directory.name))
 
 
-def validate(fpath: Path, errors):
+def check_directory(tree: TreeSnapshot, directory: Path) -> List[str]:
     """
-    Validates the directory structure and naming conventions for versioned directories.
+    Checks the naming conventions of a versioned directory and of its siblings.
     """
-
-    fpath_parent = Path(fpath.parent)
-    # check if fpath is leaf and versioned dir
+    # check if directory is leaf and versioned dir
     if (
-        not fpath_parent.is_dir()
-        or not is_leaf_directory(fpath_parent)
-        or not is_versioned_directory(fpath_parent)
-        or fpath_parent.name == "latest"
+        not tree.is_dir(directory)
+        or not is_leaf_directory(directory, tree)
+        or not is_versioned_directory(directory)
+        or directory.name == "latest"
     ):
-        log.debug(f"'{fpath_parent.name}' in path '{fpath_parent}' is not checked")
-        return True
+        log.debug(f"'{directory.name}' in path '{directory}' is not checked")
+        return []
 
-    log.debug(f"{fpath_parent} is a leaf and versioned dir")
-    sibling_dirs = sibling_directories(fpath_parent)
+    log.debug(f"{directory} is a leaf and versioned dir")
+    sibling_dirs = sibling_directories(directory, tree)
 
     # Remove 'latest' from sibling_dirs and check if there are more than one directory
     version_dirs = []
@@ -67,29 +58,33 @@ def validate(fpath: Path, errors):
         if str(dir.name) != "latest":
             version_dirs.append(dir.name)
     if len(version_dirs) < 2:
-        return True
+        return []
 
     log.debug(f"Versioned directories to validate: {version_dirs}")
 
     # Verify that all version directories start with a number or "v"
+    #  and match the versioning pattern
     if not (
         all(re.match(r"v\d", version) for version in version_dirs)
         or all(version[0].isdigit() for version in version_dirs)
-    ):
+    ) or not (all(re.match(VERSION_PATTERN, version) for version in version_dirs)):
         log.debug(
-            f"Inconsistent versioning pattern found for {fpath_parent}: {version_dirs}"
-        )
-        errors.append(
-            f"Inconsistent versioning pattern found for {fpath_parent}: {version_dirs}"
+            f"Inconsistent versioning pattern found for {directory}: {version_dirs}"
         )
-        return False
+        return [
+            f"Inconsistent versioning pattern found for {directory}: {version_dirs}"
+        ]
 
-    # Verify that all version directories match the versioning pattern
-    if not (all(re.match(VERSION_PATTERN, version) for version in version_dirs)):
-        log.debug(f"Inconsistent versioning pattern found for {fpath}: {version_dirs}")
-        errors.append(
-            f"Inconsistent versioning pattern found for {fpath}: {version_dirs}"
-        )
-        return False
+    return []
+
+
+def validate(fpath: Path, errors, context: ValidationContext = None):
+    """
+    Validates the directory structure and naming conventions for versioned directories.
 
-    return True
+    The directory of `fpath` is checked once, whatever the number of its files.
+    """
+    context = context or ValidationContext(fpath)
+    directory_errors = context.tree.check(check_directory, fpath.parent)
+    errors.extend(directory_errors)
+    return not directory_errors
@@ -1,6 +1,10 @@
 import logging
 import re
 from pathlib import Path
+from typing import List
+
+from dati_playground.validators.context import ValidationContext
+from dati_playground.validators.tree import TreeSnapshot
 
 log = logging.getLogger(__name__)
 
@@ -8,37 +12,43 @@ pattern = r"^[a-zA-Z][\\.a-zA-Z0-9_-]{1,63}$"
 extensions_to_check = [".ttl", ".rdf", ".csv", ".yaml"]
 
 
-def validate(fpath: Path, errors: list):
+def check_directory_name(tree: TreeSnapshot, dir_path: Path) -> List[str]:
+    dir_name = dir_path.name
+    if not re.match(pattern, dir_name):
+        log.debug(
+            f"The name of the directory '{dir_name}' in path '{dir_path}' does not match the required pattern"
+        )
+        return [
+            f"The name of the directory '{dir_name}' in path '{dir_path}' does not match the required pattern"
+        ]
+    return []
+
+
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
 
     # Check if the file has a extension to check
     if fpath.suffix.lower() not in extensions_to_check:
         log.debug(f"The file '{fpath}' does not have a extension to check")
         return True
 
-    # Check the name of the file and parent directories
+    context = context or ValidationContext(fpath)
+    file_errors = []
+    # Check the name of the file and parent directories,
+    #  once per directory.
     dirs = [fpath.parent] + list(fpath.parents)[
         :2
     ]  # Get up to 3 levels of parent directories
     for dir_path in dirs:
-        dir_name = dir_path.name
-        if not re.match(pattern, dir_name):
-            log.debug(
-                f"The name of the directory '{dir_name}' in path '{dir_path}' does not match the required pattern"
-            )
-            errors.append(
-                f"The name of the directory '{dir_name}' in path '{dir_path}' does not match the required pattern"
-            )
+        file_errors += context.tree.check(check_directory_name, dir_path)
 
     # Check the name of the file
     if not re.match(pattern, fpath.stem):
         log.debug(
             f"The name of the file '{fpath.name}' in path '{fpath.parent}' does not match the required pattern"
         )
-        errors.append(
+        file_errors.append(
             f"The name of the file '{fpath.name}' in path '{fpath.parent}' does not match the required pattern"
         )
 
-    if errors:
-        return False
-
-    return True
+    errors.extend(file_errors)
+    return not file_errors
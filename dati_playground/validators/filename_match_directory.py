@@ -2,6 +2,8 @@ import logging
 import re
 from pathlib import Path
 
+from dati_playground.validators.context import ValidationContext
+
 log = logging.getLogger(__name__)
 
 # List of filenames to be excluded
@@ -30,7 +32,7 @@ EXCLUDED_EXTENSIONS = [
 ]
 
 
-def validate(fpath: Path, errors):
+def validate(fpath: Path, errors, context: ValidationContext = None):
 
     if fpath.is_dir():
         log.debug(f"The dir '{fpath.name}' in path '{fpath}' is not checked")
@@ -4,22 +4,25 @@ from typing import List
 
 from rdflib import OWL, RDF, SKOS, Graph, Namespace
 
+from dati_playground.validators.context import ValidationContext
+
 log = logging.getLogger(__name__)
 
 
-def extract_main_uri(ttl_fpath: Path):
+def extract_main_uri(ttl_fpath: Path, g: Graph = None):
     """
     Extracts the main URI relative to the specified TTL file.
 
     Args:
         ttl_fpath (Path): The path of the TTL file.
+        g (Graph): The graph of the TTL file, if already parsed.
 
     Returns:
         str: The main relative URI if found, otherwise None.
     """
     try:
-        g = Graph()
-        g.parse(str(ttl_fpath), format="ttl")
+        if g is None:
+            g = ValidationContext(ttl_fpath).graph
     except Exception as e:
         # errors.append(f"{fpath} is not a valid Turtle file: {e}")
         raise Exception(e)
@@ -45,7 +48,7 @@ def extract_main_uri(ttl_fpath: Path):
     return main_uri
 
 
-def validate(fpath: Path, errors: List[str]):
+def validate(fpath: Path, errors: List[str], context: ValidationContext = None):
 
     log.debug(f"File Path:{fpath}")
     suffix = fpath.suffix
@@ -55,7 +58,8 @@ def validate(fpath: Path, errors: List[str]):
 
     # Extract uri from file path
     try:
-        uri = extract_main_uri(fpath)
+        context = context or ValidationContext(fpath)
+        uri = extract_main_uri(fpath, context.graph)
         log.debug(f"URI: {uri}")
     except Exception as e:
         errors.append(
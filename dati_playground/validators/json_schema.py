@@ -4,14 +4,20 @@ from pathlib import Path
 import jsonschema
 import yaml
 
+from dati_playground.validators.context import ValidationContext
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+# Results only depend on the content of the file.
+CACHEABLE = True
+
 
-def validate(fpath: Path, errors: list):
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
+    context = context or ValidationContext(fpath)
     try:
-        schema = yaml.safe_load(fpath.read_text())
-    except yaml.YAMLError as e:
+        schema = context.yaml
+    except (yaml.YAMLError, UnicodeDecodeError) as e:
         log.debug(f"Failed to parse YAML file {fpath}: \n{e}")
         errors.append(f"Failed to parse YAML file {fpath}: \n{e}")
         return False
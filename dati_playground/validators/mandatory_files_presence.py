@@ -1,70 +1,68 @@
 import logging
 from pathlib import Path
+from typing import List
+
+from dati_playground.validators.context import ValidationContext
+from dati_playground.validators.tree import TreeSnapshot
 
 log = logging.getLogger(__name__)
 
 
-def is_leaf_directory(directory: Path) -> bool:
+def is_leaf_directory(directory: Path, tree: TreeSnapshot = None) -> bool:
     """
     Checks if the directory does not contain any subdirectories.
     """
-    for subdir in directory.iterdir():
-        if subdir.is_dir():
-            return False
-    return True
+    return (tree or TreeSnapshot()).is_leaf(directory)
 
 
-def validate(fpath: Path, errors):
+def check_directory(tree: TreeSnapshot, directory: Path) -> List[str]:
     """
-    Checks if the directory containing the given file is a leaf directory and contains at least one turtle (.ttl) file.
-    If the directory path contains 'schemas', it also verifies the presence of .oas3.yaml and index.ttl files.
+    Checks the mandatory files of a leaf directory.
     """
-
-    directory = fpath.parent
-
-    if not is_leaf_directory(directory):
+    if not is_leaf_directory(directory, tree):
         log.debug(f"'{directory.name}' in path '{directory}' is not a leaf directory")
-        return True
+        return []
 
-    has_turtle_file = any(
-        file.suffix == ".ttl" for file in directory.iterdir() if file.is_file()
-    )
+    files = tree.files(directory)
+    has_turtle_file = any(file.suffix == ".ttl" for file in files)
     if not has_turtle_file:
         log.debug(
             f"Leaf directory '{directory}' does not contain any turtle (.ttl) file"
         )
-        errors.append(
-            f"Leaf directory '{directory}' does not contain any turtle (.ttl) file"
-        )
-        return False
+        return [f"Leaf directory '{directory}' does not contain any turtle (.ttl) file"]
 
     # Additional check for directories containing 'schemas'
     if "schemas" in directory.parts:
-        has_oas3_yaml_file = any(
-            file.name.endswith(".oas3.yaml")
-            for file in directory.iterdir()
-            if file.is_file()
-        )
+        has_oas3_yaml_file = any(file.name.endswith(".oas3.yaml") for file in files)
         if not has_oas3_yaml_file:
             log.debug(
                 f"The 'schemas' directory '{directory}' does not contain a .oas3.yaml file"
             )
-            errors.append(
+            return [
                 f"The 'schemas' directory '{directory}' does not contain a .oas3.yaml file"
-            )
-            return False
+            ]
 
         # Check if there is a file named 'index.ttl'
-        has_index_ttl = any(
-            file.name == "index.ttl" for file in directory.iterdir() if file.is_file()
-        )
+        has_index_ttl = any(file.name == "index.ttl" for file in files)
         if not has_index_ttl:
             log.debug(
                 f"The 'schemas' directory '{directory}' does not contain any 'index.ttl' file"
             )
-            errors.append(
+            return [
                 f"The 'schemas' directory '{directory}' does not contain any 'index.ttl' file"
-            )
-            return False
+            ]
+
+    return []
 
-    return True
+
+def validate(fpath: Path, errors, context: ValidationContext = None):
+    """
+    Checks if the directory containing the given file is a leaf directory and contains at least one turtle (.ttl) file.
+    If the directory path contains 'schemas', it also verifies the presence of .oas3.yaml and index.ttl files.
+
+    The directory of `fpath` is checked once, whatever the number of its files.
+    """
+    context = context or ValidationContext(fpath)
+    directory_errors = context.tree.check(check_directory, fpath.parent)
+    errors.extend(directory_errors)
+    return not directory_errors
@@ -4,15 +4,20 @@ from pathlib import Path
 import yaml
 from openapi_spec_validator import validate_spec
 
+from dati_playground.validators.context import ValidationContext
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+# Results only depend on the content of the file.
+CACHEABLE = True
+
 
-def validate(fpath: Path, errors: list):
-    content = fpath.read_text()
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
+    context = context or ValidationContext(fpath)
     try:
-        spec_dict = yaml.safe_load(content)
-    except yaml.YAMLError as e:
+        spec_dict = context.yaml
+    except (yaml.YAMLError, UnicodeDecodeError) as e:
         log.debug(f"Failed to parse YAML file {fpath} \n{e}")
         errors.append(f"Failed to parse YAML file {fpath} \n{e}")
         return False
@@ -1,5 +1,9 @@
 import logging
 from pathlib import Path
+from typing import List
+
+from dati_playground.validators.context import ValidationContext
+from dati_playground.validators.tree import TreeSnapshot
 
 log = logging.getLogger(__name__)
 
@@ -10,43 +14,46 @@ required_subdirs = [
 ]
 
 
-def validate(fpath: Path, errors: list):
+def check_root(tree: TreeSnapshot, root_dir: Path) -> List[str]:
     """
-    Validate directory structure to ensure required root directories exist.
-    Check that the structure of the assets directories
-    complies with required_subdirs.
-
-    Args:
-        fpath (Path): The path of the file from which to obtain The path of the root directory to check.
-
+    Check that the direct subdirectories of `root_dir` comply with required_subdirs.
     """
-
-    root_dir = Path(fpath.parts[0])
-
-    if not root_dir.is_dir():
+    if not tree.is_dir(root_dir):
         log.warning(f"{root_dir} is not a directory.")
-        return True
+        return []
 
     subdirs = []
-    for subdir in root_dir.iterdir():
-        if subdir.is_dir():
-            subdirs.append(str("/".join(subdir.parts)).lower())
+    for subdir in tree.subdirectories(root_dir):
+        subdirs.append(str("/".join(subdir.parts)).lower())
 
     # Check if all direct subdirectories are present in required_subdirs
     required_subdirs_lower = [d.lower() for d in required_subdirs]
 
-    if set(subdirs) <= set(required_subdirs_lower):
-        return True
-    else:
-        # Find missing subdirectories
-        missing_dirs = set(subdirs) - set(required_subdirs_lower)
-
-        if missing_dirs:
-            log.debug(
-                f"One or more directories do not conform to the expected structure in '{root_dir}' dir: {missing_dirs}"
-            )
-            errors.append(
-                f"One or more directories do not conform to the expected structure in '{root_dir}' dir: {missing_dirs}"
-            )
-
-        return False
+    # Find the subdirectories not in required_subdirs
+    missing_dirs = set(subdirs) - set(required_subdirs_lower)
+    if missing_dirs:
+        log.debug(
+            f"One or more directories do not conform to the expected structure in '{root_dir}' dir: {missing_dirs}"
+        )
+        return [
+            f"One or more directories do not conform to the expected structure in '{root_dir}' dir: {missing_dirs}"
+        ]
+    return []
+
+
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
+    """
+    Validate directory structure to ensure required root directories exist.
+    Check that the structure of the assets directories
+    complies with required_subdirs.
+
+    The root directory is checked once, whatever the number of files.
+
+    Args:
+        fpath (Path): The path of the file from which to obtain The path of the root directory to check.
+
+    """
+    context = context or ValidationContext(fpath)
+    root_errors = context.tree.check(check_root, Path(fpath.parts[0]))
+    errors.extend(root_errors)
+    return not root_errors
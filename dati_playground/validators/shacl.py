@@ -1,18 +1,38 @@
+"""
+SHACL validation of the Turtle files against their closest rules.shacl.
+
+Files are usually validated in batches sharing the same rules.shacl
+(see `group_by_rules`): each rules.shacl is parsed once per process,
+and reused for all the files.
+"""
+
 import logging
+from collections import defaultdict
 from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 from pyshacl import validate as pyshacl_validate
 from rdflib import Graph
 
+from dati_playground.validators.cache import file_hash
+from dati_playground.validators.context import ValidationContext
+
 log = logging.getLogger(__name__)
 
 MAX_DEPTH = 5
 basedir = Path(__file__).parent
+# Results only depend on the file and on its rules.shacl.
+CACHEABLE = True
 
 
 @lru_cache(maxsize=100)
-def get_shacl_graph(absolute_path: str) -> Graph:
+def get_shacl_graph(absolute_path: str, digest: str = None) -> Graph:
+    """Parse a rules.shacl.
+
+    :param digest: the hash of the file, so that a long-running process,
+        eg. the validation daemon, parses it again when it changes.
+    """
     if not Path(absolute_path).is_absolute():
         raise ValueError(f"{absolute_path} is not an absolute path")
     log.debug(f"Loading SHACL graph from {absolute_path}")
@@ -21,26 +41,58 @@ def get_shacl_graph(absolute_path: str) -> Graph:
     return shacl_graph
 
 
-def validate(fpath: Path, errors: list):
-    log.debug("Validating {}".format(fpath))
-    shacl_graph = None
-    rule_file_path = None
+def find_rules(fpath: Path) -> Optional[Path]:
+    """Return the closest rules.shacl in the parent directories of `fpath`."""
     rule_dir = fpath.parent
     for _ in range(MAX_DEPTH):
         rule_file_candidate = rule_dir / "rules.shacl"
         if rule_file_candidate.exists():
-            rule_file_path = rule_file_candidate.absolute().as_posix()
-            shacl_graph = get_shacl_graph(rule_file_path)
-            log.debug(f"Found shacl file: {rule_file_path}")
-            break
+            return rule_file_candidate.absolute()
         if rule_dir == basedir:
             break
         rule_dir = rule_dir.parent
+    return None
+
+
+def dependencies(fpath: Path) -> List[Path]:
+    rules = find_rules(fpath)
+    return [rules] if rules else []
+
+
+def group_by_rules(fpaths: Iterable[Path]) -> Dict[Optional[Path], List[Path]]:
+    """Group the files by their closest rules.shacl, preserving their order."""
+    groups = defaultdict(list)
+    for fpath in fpaths:
+        groups[find_rules(Path(fpath))].append(fpath)
+    return dict(groups)
+
+
+def validate_graph(g: Graph, rule_file_path: Optional[str]):
+    """Validate a graph with the shared rules graph of `rule_file_path`.
+
+    `g` is never validated in place, since SHACL rules may add triples
+    to it and it is shared with the other validators, eg. by the daemon.
+
+    :returns: the (conforms, results_graph, results_text) tuple of pyshacl.
+    """
+    # Enable advanced shacl validation: https://www.w3.org/TR/shacl-af/
+    if rule_file_path is None:
+        return pyshacl_validate(g, advanced=True)
+
+    shacl_graph = get_shacl_graph(rule_file_path, file_hash(rule_file_path))
+    return pyshacl_validate(g, shacl_graph=shacl_graph, advanced=True)
+
+
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
+    log.debug("Validating {}".format(fpath))
+    context = context or ValidationContext(fpath)
+    rule_file_path = None
+    rules = find_rules(fpath)
+    if rules:
+        rule_file_path = rules.as_posix()
+        log.debug(f"Found shacl file: {rule_file_path}")
     try:
-        # Enable advanced shacl validation: https://www.w3.org/TR/shacl-af/
-        is_valid, graph, report_text = pyshacl_validate(
-            fpath.as_posix(), shacl_graph=shacl_graph, advanced=True
-        )
+        is_valid, graph, report_text = validate_graph(context.graph, rule_file_path)
         log.debug(
             f"Validation result: {fpath}, {is_valid}, {rule_file_path}, {report_text}"
         )
@@ -0,0 +1,72 @@
+"""
+In-memory snapshot of the asset tree shared by the structural validators.
+
+Validators checking the layout of the repository inspect
+the same directories for every file they validate.
+A TreeSnapshot lists each directory at most once,
+and runs each directory-level check once per directory:
+the following files of the directory reuse its errors.
+
+A snapshot is shared by the files validated in the same batch,
+so it must not outlive the run: files created afterwards are not seen.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class TreeSnapshot:
+    def __init__(self):
+        self._listings: Dict[Path, Optional[Tuple[List[Path], List[Path]]]] = {}
+        self._checks: Dict[tuple, List[str]] = {}
+
+    def _listing(self, directory: Path) -> Optional[Tuple[List[Path], List[Path]]]:
+        """Return the (subdirectories, files) of `directory`, in the order
+        of `Path.iterdir()`, or None if it is not a directory."""
+        directory = Path(directory)
+        if directory not in self._listings:
+            log.debug(f"Listing {directory}")
+            try:
+                subdirs, files = [], []
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        (subdirs if entry.is_dir() else files).append(
+                            directory / entry.name
+                        )
+                self._listings[directory] = (subdirs, files)
+            except (FileNotFoundError, NotADirectoryError):
+                self._listings[directory] = None
+        return self._listings[directory]
+
+    def is_dir(self, path: Path) -> bool:
+        return self._listing(path) is not None
+
+    def subdirectories(self, directory: Path) -> List[Path]:
+        listing = self._listing(directory)
+        return listing[0] if listing else []
+
+    def files(self, directory: Path) -> List[Path]:
+        listing = self._listing(directory)
+        return listing[1] if listing else []
+
+    def is_leaf(self, directory: Path) -> bool:
+        """Return True if `directory` does not contain any subdirectories."""
+        return not self.subdirectories(directory)
+
+    def siblings(self, directory: Path) -> List[Path]:
+        """Return the directories at the same level of `directory`, itself included."""
+        return self.subdirectories(Path(directory).parent)
+
+    def check(self, check: Callable[["TreeSnapshot", Path], List[str]], directory):
+        """Run `check(tree, directory)` once per directory.
+
+        :returns: the errors of the check.
+        """
+        key = (check, Path(directory))
+        if key not in self._checks:
+            self._checks[key] = check(self, Path(directory))
+        return self._checks[key]
@@ -1,21 +1,158 @@
+"""
+Turtle validation.
+
+`validate` parses the file into the graph of the ValidationContext,
+shared with the validators needing it, eg. shacl.
+
+`validate_syntax` only checks the syntax: the file is read in chunks
+and fed to the rdflib parser one statement at a time, discarding the triples,
+so that its memory does not depend on the size of the file.
+"""
+
+import codecs
 import logging
+import re
 from pathlib import Path
+from typing import Iterator, Tuple
 
-from rdflib import Graph
-from rdflib.plugins.parsers.notation3 import BadSyntax
+from rdflib.plugins.parsers.notation3 import BadSyntax, RDFSink, SinkParser
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-from dati_playground.utils import MIME_TURTLE
+from dati_playground.validators.context import ValidationContext
+
+# Results only depend on the content of the file.
+CACHEABLE = True
+CHUNK_SIZE = 1 << 20
+# A statement failing to parse is retried with more text, in case it was
+#  truncated, until the text exceeds this size.
+MAX_STATEMENT_SIZE = 16 << 20
+# Outside of literals and IRIs, a dot followed by a space ends a statement.
+STATEMENT_END = re.compile(r"\.\s")
+
+
+class TurtleSyntaxError(ValueError):
+    def __init__(self, line: int, column: int, why: str, excerpt: str):
+        self.line = line
+        self.column = column
+        self.why = why
+        super().__init__(
+            f"Bad syntax ({why}) at line {line}, column {column}: {excerpt!r}"
+        )
+
+
+class DiscardingSink(RDFSink):
+    """An rdflib parser sink dropping the parsed triples."""
+
+    def __init__(self):
+        super().__init__(graph=None)
+
+    def makeStatement(self, quadruple, why=None):
+        pass
+
+
+def read_chunks(fpath: Path, size: int = CHUNK_SIZE) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(size), b""):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
 
 
-def validate(fpath: Path, errors: list):
+def check_syntax(fpath: Path, chunk_size: int = CHUNK_SIZE):
+    """Parse a Turtle file without storing its triples.
+
+    :raises TurtleSyntaxError: with the line and column of the first error.
+    :raises UnicodeDecodeError: if the file is not UTF-8.
+    """
+    fpath = Path(fpath)
+    parser = SinkParser(
+        DiscardingSink(), baseURI=fpath.absolute().as_uri(), turtle=True
+    )
+    parser.startDoc()
+    # The text not parsed yet, starting at `line` and `column`.
+    pending, line, column = "", 1, 1
+
+    def parse(end: int, eof: bool, strict: bool) -> Tuple[int, bool]:
+        """Parse the statements in pending[:end], and drop them from `pending`.
+
+        :param eof: if False, the text after the last statement
+            may be truncated, eg. in a comment containing ". ":
+            it is kept to be parsed again with more text.
+        :param strict: if False, a failed statement may be truncated too,
+            so it is kept instead of raising an error.
+        :returns: the length of the text dropped, and whether
+            a statement failed to parse.
+        """
+        nonlocal pending, line, column
+        text, i, failed = pending[:end], 0, False
+        while True:
+            j = parser.skipSpace(text, i)
+            if j < 0:
+                if eof:
+                    i = len(text)
+                break
+            try:
+                k = parser.directiveOrStatement(text, j)
+                if k < 0:
+                    parser.BadSyntax(text, j, "expected directive or statement")
+            except Exception as e:
+                # Truncated literals may raise other errors, eg. AssertionError.
+                if not strict:
+                    failed = True
+                    break
+                if not isinstance(e, BadSyntax):
+                    raise
+                # BadSyntax only counts the lines in between statements.
+                lines, start = text.count("\n", 0, e._i), max(e._i - 40, 0)
+                raise TurtleSyntaxError(
+                    line + lines,
+                    e._i - text.rfind("\n", 0, e._i) if lines else column + e._i,
+                    e._why,
+                    text[start:][:80],
+                ) from e
+            i = k
+        lines = text.count("\n", 0, i)
+        line += lines
+        column = i - text.rfind("\n", 0, i) if lines else column + i
+        pending = pending[i:]
+        # Blank node labels are only needed to build the graph.
+        parser._anonymousNodes.clear()
+        return i, failed
+
+    # The last cut in `pending`, and the size of `pending`
+    #  at which a failed statement is parsed again, doubling each time.
+    end = retry = 0
+    for chunk in read_chunks(fpath, chunk_size):
+        start = max(len(pending) - 1, 0)
+        pending += chunk
+        for m in STATEMENT_END.finditer(pending, start):
+            end = m.end()
+        if end and len(pending) >= retry:
+            strict = len(pending) > MAX_STATEMENT_SIZE
+            consumed, failed = parse(end, eof=False, strict=strict)
+            retry = 2 * len(pending) if failed else 0
+            end -= consumed
+    parse(len(pending), eof=True, strict=True)
+    parser.endDoc()
+
+
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
+    context = context or ValidationContext(fpath)
     try:
-        content = fpath.read_text(encoding="utf-8")
-        g = Graph()
-        g.parse(data=content, format=MIME_TURTLE)
+        context.graph
         return True
     except (BadSyntax, Exception) as e:
         errors.append(f"{fpath} is not a valid Turtle file: {e}")
         return False
+
+
+def validate_syntax(fpath: Path, errors: list, context: ValidationContext = None):
+    """Like validate, without building the graph."""
+    try:
+        check_syntax(fpath)
+        return True
+    except Exception as e:
+        errors.append(f"{fpath} is not a valid Turtle file: {e}")
+        return False
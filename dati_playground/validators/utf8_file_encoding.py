@@ -1,12 +1,17 @@
 import logging
 from pathlib import Path
 
+from dati_playground.validators.context import ValidationContext
+
 log = logging.getLogger(__name__)
 
+# Results only depend on the content of the file.
+CACHEABLE = True
+
 EXCLUDED_EXTENSIONS = [".md", ".png"]
 
 
-def validate(fpath: Path, errors: list):
+def validate(fpath: Path, errors: list, context: ValidationContext = None):
     """
     Verifies if the specified file is encoded in UTF-8.
     """
@@ -18,9 +23,9 @@ def validate(fpath: Path, errors: list):
         log.debug(f"'{fpath.name}' in path '{fpath}' is not checked")
         return True
 
+    context = context or ValidationContext(fpath)
     try:
-        with open(fpath, "r", encoding="utf-8") as file:
-            _ = file.read()
+        context.text
         log.debug(f"The file '{fpath}' is encoded in UTF-8")
         return True
     except UnicodeDecodeError:
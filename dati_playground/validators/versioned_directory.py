@@ -1,42 +1,155 @@
+"""
+Check that the files in `latest/` are the same as in the highest version directory.
+
+Files are compared by hash first, then line by line.
+With `validate_graphs`, Turtle files with different hashes are compared
+by the hash of their graphs instead, so that serializing the same triples
+in another order is not a difference: the textual diff is only computed
+to report the files that differ.
+Hashing a graph requires parsing it, which is slower than the diff
+of different files, but it is cached per file content.
+"""
+
 import difflib
+import hashlib
 import logging
-from distutils.version import LooseVersion
+from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
+
+from dati_playground.validators.context import ValidationContext
 
 log = logging.getLogger(__name__)
 
+RDF_SUFFIXES = (".ttl", ".shacl")
+# Relative URIs are resolved against the same base in both directories.
+BASE_URI = "urn:x-dati-playground:versioned-directory:"
+
+
+def graph_hash(g) -> Optional[str]:
+    """Return a hash of the triples of `g`, which does not depend
+    on their order nor on the blank node ids.
+
+    rdflib.compare.to_isomorphic takes hours on the largest vocabularies,
+    so blank nodes are labeled by refining the hashes of their neighbourhoods
+    until they do not change.
+
+    :returns: None if some blank nodes cannot be told apart,
+        so that their graphs cannot be compared by hash.
+    """
+    from rdflib import BNode
+
+    edges = defaultdict(list)
+    for s, p, o in g:
+        if isinstance(s, BNode):
+            edges[s].append((">", p, o))
+        if isinstance(o, BNode):
+            edges[o].append(("<", p, s))
+
+    labels = dict.fromkeys(edges, "")
+
+    def n3(term) -> str:
+        return f"_:{labels[term]}" if isinstance(term, BNode) else term.n3()
+
+    classes = 1 if labels else 0
+    while classes < len(labels):
+        labels = {
+            bnode: hashlib.sha256(
+                "\n".join(
+                    [labels[bnode], *sorted(f"{d} {p.n3()} {n3(t)}" for d, p, t in e)]
+                ).encode()
+            ).hexdigest()
+            for bnode, e in edges.items()
+        }
+        refined = len(set(labels.values()))
+        if refined == classes:
+            return None
+        classes = refined
+
+    digest = hashlib.sha256()
+    for line in sorted(f"{n3(s)} {p.n3()} {n3(o)}" for s, p, o in g):
+        digest.update(line.encode() + b"\n")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def canonical_hash(absolute_path: str, digest: str) -> Optional[str]:
+    """Return the graph_hash of a Turtle file.
+
+    :param digest: the hash of the file, only used as the cache key,
+        so that the graph is hashed once per file content.
+    """
+    from rdflib import Graph
 
-def validate(fpath: Path, errors: list):
+    from dati_playground.utils import MIME_TURTLE
+
+    log.debug(f"Hashing the graph of {absolute_path}")
+    g = Graph()
+    g.parse(absolute_path, format=MIME_TURTLE, publicID=BASE_URI)
+    return graph_hash(g)
+
+
+def same_graph(cpath: Path, cdigest: str, fpath: Path, fdigest: str) -> bool:
+    if fpath.suffix not in RDF_SUFFIXES:
+        return False
+    try:
+        chash = canonical_hash(cpath.absolute().as_posix(), cdigest)
+        return chash is not None and chash == canonical_hash(
+            fpath.absolute().as_posix(), fdigest
+        )
+    except Exception as e:
+        # Invalid files are reported by the turtle validator.
+        log.debug(f"Cannot compare the graphs of {cpath} and {fpath}: {e}")
+        return False
+
+
+def validate(
+    fpath: Path,
+    errors: list,
+    context: ValidationContext = None,
+    compare_graphs: bool = False,
+):
     if fpath.parent.name != "latest":
         return
     # log.info(fpath)
+    context = context or ValidationContext(fpath)
     folders = [
         x.name
-        for x in fpath.parent.parent.glob("*/")
-        if x.name != "latest" and x.is_dir() and x.name[:2] != "v."
+        for x in context.tree.subdirectories(fpath.parent.parent)
+        if x.name != "latest" and x.name[:2] != "v." and not x.name.startswith(".")
     ]
     log.debug("Identified folders: %r", (folders,))
     if not folders:
         log.debug(f"No versioned directories found for {fpath}")
         return True
+    # distutils is slow to import.
+    from distutils.version import LooseVersion
+
     try:
         last_version_dirname = sorted(LooseVersion(x) for x in folders)[-1].vstring
         log.debug("Version: %r", (last_version_dirname,))
         cpath = fpath.parent.parent / last_version_dirname / fpath.name
-    except Exception as e:
+    except Exception:
         errors.append(
             f"Exception scanning versioned directories {folders} in path {fpath.parent.parent}"
         )
         return False
 
     try:
-        with open(cpath, encoding="utf-8") as f_latest, open(
-            fpath, encoding="utf-8"
-        ) as f_version:
+        cdigest = hashlib.sha256(cpath.read_bytes()).hexdigest()
+        fdigest = hashlib.sha256(context.content).hexdigest()
+        if cdigest == fdigest or (
+            compare_graphs and same_graph(cpath, cdigest, fpath, fdigest)
+        ):
+            log.debug(f"File {cpath} is up to date with {fpath}")
+            return True
+
+        with open(cpath, encoding="utf-8") as f_latest:
             diffs = []
             diff = difflib.unified_diff(
                 f_latest.readlines(),
-                f_version.readlines(),
+                context.text.splitlines(keepends=True),
                 fromfile=cpath.as_posix(),
                 tofile=fpath.as_posix(),
             )
@@ -55,3 +168,8 @@ def validate(fpath: Path, errors: list):
     except Exception as e:
         errors.append(f"{e}")
         return False
+
+
+def validate_graphs(fpath: Path, errors: list, context: ValidationContext = None):
+    """Like validate, but Turtle files with the same triples are the same."""
+    return validate(fpath, errors, context, compare_graphs=True)
@@ -1,21 +1,72 @@
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import signal
 import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Iterable, Tuple
-from urllib.parse import ParseResult, parse_qsl, urlencode, urlparse, urlunparse
+from urllib.parse import (
+    ParseResult,
+    parse_qsl,
+    quote,
+    urlencode,
+    urljoin,
+    urlparse,
+    urlunparse,
+)
 
 import click
 import connexion
+import metrics
 import requests
+import uvicorn
 import yaml
+from autocomplete import PrefixIndex, label_fields
 from connexion import problem
-from flask import current_app, request
+from datasync import (
+    NO_CACHE_HEADERS,
+    URI_INDEX_TABLE,
+    download_file,
+    hold_datastore,
+    manifest_path,
+    published_checksum,
+    remove_datastore,
+    sync_datastore,
+    sync_lock,
+)
+from flask import Flask, Response, current_app, g, request, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import create_engine
-from werkzeug.exceptions import NotFound
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from werkzeug.exceptions import BadRequest, NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+DATASTORE_FILE_ENV = "NDC_RESTAPI_DATASTORE_FILE"
+DATASTORE_URL_ENV = "NDC_RESTAPI_DATASTORE_URL"
+DATASTORE_RELOAD_INTERVAL_ENV = "NDC_RESTAPI_RELOAD_INTERVAL"
+DATASTORE_MMAP_SIZE = 1 << 30
+CACHE_CONTROL_LATEST = "max-age=36000"
+# Published versions never change.
+CACHE_CONTROL_PINNED = "public, max-age=31536000, immutable"
+MIME_JSONLD = "application/ld+json"
 
 
 def initdb(table_name):
@@ -41,8 +92,197 @@ def get_status():
     )
 
 
-def sql_execute(*args):
-    return current_app.config["db"].execute(*args)
+def connect_datastore(dbfile: Path, mmap_size: int = DATASTORE_MMAP_SIZE) -> Engine:
+    """Open the datastore in read-only mode.
+
+    The file is opened as immutable and memory-mapped, so that
+    all the worker processes share the same pages
+    of the OS page cache without any locking.
+    """
+    engine = create_engine(
+        f"sqlite:///file:{Path(dbfile).absolute()}?mode=ro&immutable=1&uri=true"
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_mmap_size(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+    return engine
+
+
+def warm_up(app: Flask, engine: Engine = None) -> Dict[str, Dict]:
+    """Load the vocabulary catalog and scan the key indexes,
+    so that the first requests served by a worker do not pay
+    for faulting the datastore pages into memory.
+
+    :param engine: the datastore to warm up, defaults to the current one.
+    :returns: the catalog.
+    """
+    with app.app_context():
+        if engine is not None:
+            g.engine = engine
+        catalog = get_catalog()
+        for vocabulary in catalog.values():
+            for version in vocabulary["versions"].values():
+                sql_execute(f"""SELECT count(key) FROM "{version['table']}";""")
+        log.info(f"Worker {os.getpid()} is ready.")
+    return catalog
+
+
+def create_app(dbfile: Path = None) -> connexion.FlaskApp:
+    """Create the API application serving the given datastore.
+
+    When `dbfile` is not set, it is read from
+    the NDC_RESTAPI_DATASTORE_FILE environment variable,
+    so that this can be used as an application factory
+    by every worker process.
+    """
+    dbfile = dbfile or Path(os.environ[DATASTORE_FILE_ENV])
+    zapp = connexion.FlaskApp(__name__)
+    CORS(zapp.app)
+
+    zapp.add_api("vocabularies.yaml", validate_responses=False)
+    zapp.app.config.update({"db": connect_datastore(dbfile), "db_file": dbfile})
+    zapp.app.teardown_appcontext(close_db)
+    metrics.init_app(zapp.app)
+    zapp.app.after_request(compress_response)
+
+    metrics.observe_datastore(dbfile, warm_up(zapp.app))
+
+    dburl = os.environ.get(DATASTORE_URL_ENV)
+    interval = int(os.environ.get(DATASTORE_RELOAD_INTERVAL_ENV, 0))
+    if dburl and interval:
+        zapp.app.config.update(
+            {
+                "db_checksum": published_checksum(dbfile),
+                "db_hold": hold_datastore(dbfile),
+            }
+        )
+        start_reloader(zapp.app, dburl, interval)
+    return zapp
+
+
+def fetch_checksum(url: str) -> str:
+    """Return the sha256 published in `{url}.sha256`,
+    using the `sha256sum` output format.
+    """
+    res = requests.get(f"{url}.sha256", timeout=30, headers=NO_CACHE_HEADERS)
+    res.raise_for_status()
+    return res.text.split()[0].lower()
+
+
+def reload_datastore(app: Flask, url: str) -> bool:
+    """Download and serve a new datastore
+    if its checksum differs from the current one.
+
+    The new datastore is synchronized from the current one, or
+    downloaded if no manifest is published, into a file named after its
+    checksum. Workers synchronize it one at a time: the first one
+    downloads it, and the others open the same file.
+    It is warmed up before replacing the current engine, so
+    that no request hits a cold cache. Requests in flight
+    keep using the engine they started with: its connections are
+    closed once they are returned to the pool.
+    Every worker holds the datastore it serves, and the previous
+    datastores that no worker holds anymore are removed.
+
+    :returns: True if the datastore was replaced.
+    """
+    checksum = fetch_checksum(url)
+    if checksum == app.config.get("db_checksum"):
+        return False
+
+    dbfile = Path(os.environ[DATASTORE_FILE_ENV])
+    dpath = dbfile.with_name(f"{dbfile.stem}-{checksum[:16]}.db")
+    with sync_lock(dbfile):
+        if not dpath.exists():
+            try:
+                sync_datastore(url, dpath, src=app.config.get("db_file"))
+            except requests.HTTPError:
+                log.info(f"Downloading datastore from {url} into {dpath}.")
+                download_file(url, dpath, checksum)
+        hold = hold_datastore(dpath)
+
+    try:
+        engine = connect_datastore(dpath)
+        catalog = warm_up(app, engine)
+    except Exception:
+        hold.close()
+        raise
+    old_engine, old_hold = app.config["db"], app.config.get("db_hold")
+    app.config.update(
+        {"db": engine, "db_file": dpath, "db_checksum": checksum, "db_hold": hold}
+    )
+    metrics.observe_datastore(dpath, catalog, previous=_catalogs.get(old_engine))
+    old_engine.dispose()
+    log.warning(f"Worker {os.getpid()} reloaded datastore {dpath}.")
+
+    if old_hold:
+        old_hold.close()
+    # Datastores are synchronized and held with this lock, so the ones
+    #  not held are not used. Keep the configured one, synchronized on startup.
+    with sync_lock(dbfile):
+        for fpath in dbfile.parent.glob(f"{dbfile.stem}-*.db"):
+            if fpath != dpath and remove_datastore(fpath):
+                log.info(f"Removed datastore {fpath}.")
+    return True
+
+
+def start_reloader(app: Flask, url: str, interval: int) -> threading.Thread:
+    """Check for a new datastore every `interval` seconds,
+    or as soon as the worker receives SIGUSR1.
+    """
+    wake_up = threading.Event()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: wake_up.set())
+
+    def poll():
+        while True:
+            wake_up.wait(interval)
+            wake_up.clear()
+            try:
+                reload_datastore(app, url)
+            except Exception:
+                log.exception(f"Cannot reload datastore from {url}.")
+
+    reloader = threading.Thread(target=poll, name="datastore-reloader", daemon=True)
+    reloader.start()
+    return reloader
+
+
+def get_engine() -> Engine:
+    """Return the datastore engine used by the current request.
+
+    It is bound on first use, so that a request
+    is entirely served by the same datastore
+    even if a new one is loaded meanwhile.
+    """
+    if "engine" not in g:
+        g.engine = current_app.config["db"]
+    return g.engine
+
+
+def get_db() -> sqlite3.Connection:
+    """Return the DBAPI connection bound to the current request,
+    checking it out from the engine pool on first use.
+    """
+    if "db" not in g:
+        g.db = get_engine().raw_connection()
+    return g.db
+
+
+def close_db(exception=None):
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+
+def sql_execute(*args) -> sqlite3.Cursor:
+    cursor = get_db().cursor()
+    cursor.row_factory = sqlite3.Row
+    start = time.perf_counter()
+    ret = cursor.execute(*args)
+    metrics.observe_query(args[0], time.perf_counter() - start)
+    return ret
 
 
 # @lru_cache(maxsize=128)
@@ -55,51 +295,152 @@ def list_tables():
     )
     for (table_name,) in cur.fetchall():
         vocabulary = sql_execute(f"""SELECT * FROM '{table_name}'""")
-        vocabulary.cursor.row_factory = sqlite3.Row
-        yield dict(vocabulary.cursor.fetchone())
+        yield dict(vocabulary.fetchone(), table=table_name[:-5])
+
+
+def load_catalog() -> Dict[str, Dict]:
+    """Index the vocabulary versions contained in the datastore.
+
+    Versions are sorted using the `version_key` metadata
+    computed by the builder. Datastores built before its introduction
+    fall back to sorting on the version string.
+    `closure` is the name of the hierarchy closure table, if any,
+    and `labels` the prefix index of the labels used for autocompletion.
+    """
+    closures = {
+        name
+        for (name,) in sql_execute(
+            """SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name LIKE '%#closure'"""
+        )
+    }
+    catalog = {}
+    for vocabulary in list_tables():
+        vocabulary.setdefault("version_key", vocabulary["version"])
+        closure = f"{vocabulary['table']}#closure"
+        vocabulary["closure"] = closure if closure in closures else None
+        vocabulary["labels"] = load_labels(vocabulary["table"])
+        vocabulary["context_json"] = serialize_context(vocabulary.get("context"))
+        catalog.setdefault(vocabulary["name"], {"versions": {}})["versions"][
+            vocabulary["version"]
+        ] = vocabulary
+
+    for entry in catalog.values():
+        entry["latest"] = max(
+            entry["versions"].values(), key=lambda v: v["version_key"]
+        )
+    return catalog
+
+
+def load_labels(table_name: str) -> PrefixIndex:
+    columns = [
+        c for (_, c, *_) in sql_execute(f"""PRAGMA table_info("{table_name}")""")
+    ]
+    fields = label_fields(columns)
+    url = "url" if "url" in columns else "NULL"
+    rows = sql_execute(
+        f"""SELECT key, {url}, {", ".join(f'"{f}"' for f in fields) or "NULL"}
+        FROM "{table_name}" """
+    )
+    return PrefixIndex(
+        (key, url, field, label)
+        for key, url, *labels in rows
+        for field, label in zip(fields, labels)
+    )
 
 
-def last_version(vocabulary_id) -> Dict:
-    vocabularies = sql_execute(
-        f"""SELECT name FROM sqlite_master WHERE
-           (type = 'table' OR type= 'view')
-           AND name NOT LIKE 'sqlite_%'
-           AND name LIKE '{vocabulary_id}#%#meta'
-           ORDER BY name
-           LIMIT 1;"""
+def serialize_context(context: str) -> str:
+    """Parse the JSON-LD context stored in the datastore and serialize it
+    as the value of a top-level property of an indented JSON object.
+
+    Contexts are stored as JSON: YAML is only parsed
+    for datastores built before.
+    """
+    try:
+        context = json.loads(context or "{}")
+    except ValueError:
+        context = yaml.safe_load(context)
+    return json.dumps(context, indent=2, sort_keys=True).replace("\n", "\n  ")
+
+
+def jsonld_response(ret: Dict, vocabulary: Dict, headers: Dict) -> Response:
+    """Serialize `ret` as JSON-LD, splicing in the context
+    serialized when the catalog was loaded.
+
+    The output has the same format as the one of connexion,
+    with `@context` as the first property.
+    """
+    body = json.dumps(ret, indent=2, sort_keys=True)
+    body = "".join(
+        (
+            '{\n  "@context": ',
+            vocabulary["context_json"],
+            ",\n" + body[2:] if ret else "\n}",
+            "\n",
+        )
     )
-    vocabularies.cursor.row_factory = sqlite3.Row
-    ret = dict(vocabularies.cursor.fetchone())
-
-    vocabulary = sql_execute(
-        f"""SELECT *
-    FROM "{ret['name']}";"""
+    return Response(
+        body, status=200, headers=dict(headers, **{"Content-Type": MIME_JSONLD})
     )
-    vocabulary.cursor.row_factory = sqlite3.Row
-    return dict(vocabulary.cursor.fetchone(), **ret)
+
+
+_catalogs = weakref.WeakKeyDictionary()
+
+
+def get_catalog() -> Dict[str, Dict]:
+    """Return the catalog of the current datastore,
+    loading it on first use."""
+    engine = get_engine()
+    catalog = _catalogs.get(engine)
+    metrics.observe_cache("catalog", catalog is not None)
+    if catalog is None:
+        catalog = _catalogs[engine] = load_catalog()
+    return catalog
+
+
+def get_version(vocabulary_id, version=None) -> Dict:
+    """Return the metadata of a given vocabulary version,
+    or of the latest one if `version` is not set.
+
+    :raises NotFound: if the vocabulary or the version do not exist.
+    """
+    vocabulary = get_catalog().get(vocabulary_id)
+    if not vocabulary:
+        raise NotFound(f"Vocabulary: {vocabulary_id}")
+    if not version:
+        return vocabulary["latest"]
+    try:
+        return vocabulary["versions"][version]
+    except KeyError:
+        raise NotFound(f"Vocabulary: {vocabulary_id} version: {version}")
+
+
+def cache_control(version=None) -> str:
+    return CACHE_CONTROL_PINNED if version else CACHE_CONTROL_LATEST
 
 
 def list_vocabularies():
-    vocabularies = list(list_tables())
+    vocabularies = sorted(get_catalog().items())
     ret = {
         "entries": [
             {
-                "href": os.path.join(request.url, vocabulary["name"]),
-                "version": vocabulary["version"],
-                "name": vocabulary["name"],
-                "url": vocabulary["url"],
+                "href": os.path.join(request.url, name),
+                "version": vocabulary["latest"]["version"],
+                "versions": sorted(
+                    vocabulary["versions"],
+                    key=lambda v: vocabulary["versions"][v]["version_key"],
+                    reverse=True,
+                ),
+                "name": name,
+                "url": vocabulary["latest"]["url"],
             }
-            for vocabulary in vocabularies
+            for name, vocabulary in vocabularies
         ]
     }
 
     return ret
 
 
-def test_list_vocabularies():
-    assert "entries" in list_vocabularies()
-
-
 def update_url(start_url, query: Dict = None):
 
     request_url = urlparse(start_url)
@@ -110,38 +451,62 @@ def update_url(start_url, query: Dict = None):
     return urlunparse(url)
 
 
+def encode_cursor(version: str, key: str) -> str:
+    """Return an opaque pagination cursor
+    pointing after `key` in the given vocabulary version.
+    """
+    return base64.urlsafe_b64encode(json.dumps([version, key]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        version, key = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError) as e:
+        raise BadRequest(f"Invalid cursor: {cursor}") from e
+    return version, key
+
+
 # @lru_cache(maxsize=128)
-def list_entries(vocabulary_id, limit=100, cursor="", **params):
+def list_entries(vocabulary_id, limit=100, cursor="", version=None, **params):
     vocabulary, ret = _list_vocabulary(
-        vocabulary_id, limit=limit, cursor=cursor, **params
+        vocabulary_id, limit=limit, cursor=cursor, version=version, **params
     )
 
     # ret is an iterable. In this case we need to consolidate it.
     ret = list(ret)
-    last_cursor = next(iter(ret[-1].values())) if ret else ""
-
-    url_next = update_url(request.url, {"cursor": last_cursor})
-    ret = {
+    page = {
         "count": len(ret),
-        "last": last_cursor,
-        "url": url_next,
         "entries": ret,
         "version": vocabulary["version"],
     }
-
-    headers = {"Content-Type": "application/json", "cache-control": "max-age=36000"}
-    if request.headers.get("Accept") == "application/ld+json":
-        ret["@context"] = yaml.load(vocabulary["context"])
-        headers.update({"Content-Type": "application/ld+json"})
+    if ret:
+        page["last"] = ret[-1]["key"]
+    # A full page means that there may be further entries.
+    if len(ret) == limit:
+        next_cursor = encode_cursor(vocabulary["version"], ret[-1]["key"])
+        page["cursor"] = next_cursor
+        page["url"] = update_url(request.url, {"cursor": next_cursor})
+    ret = page
+
+    headers = {
+        "Content-Type": "application/json",
+        "cache-control": cache_control(version or cursor),
+    }
+    if request.headers.get("Accept") == MIME_JSONLD:
+        return jsonld_response(ret, vocabulary, headers)
 
     return ret, 200, headers
 
 
-def schema_list_entries_oneof(vocabulary_id, lang="it", schema_type="oneOf", **params):
+def schema_list_entries_oneof(
+    vocabulary_id, lang="it", schema_type="oneOf", version=None, **params
+):
     limit, cursor = 1000, ""
     if lang not in ("it", "en"):
         raise ValueError("Bad language")
-    vocabulary, ret = _list_vocabulary(vocabulary_id, limit, cursor, **params)
+    vocabulary, ret = _list_vocabulary(
+        vocabulary_id, limit, cursor, version=version, **params
+    )
     label_column = f"label_{lang}"
     if schema_type == "enum":
         ret = [x["key"] for x in ret]
@@ -171,81 +536,423 @@ def schema_list_entries_oneof(vocabulary_id, lang="it", schema_type="oneOf", **p
         }
     }
 
-    headers = {"Content-Type": "application/json", "cache-control": "max-age=36000"}
-    if request.headers.get("Accept") == "application/ld+json":
-        ret["@context"] = yaml.load(vocabulary["context"])
-        headers.update({"Content-Type": "application/ld+json"})
+    headers = {
+        "Content-Type": "application/json",
+        "cache-control": cache_control(version),
+    }
+    if request.headers.get("Accept") == MIME_JSONLD:
+        return jsonld_response(ret, vocabulary, headers)
 
     return ret, 200, headers
 
 
-def _list_vocabulary(vocabulary_id, limit, cursor, **params) -> Tuple[Dict, Iterable]:
-    current_app.logger.info(f"Params: {params}")
-    vocabulary = last_version(vocabulary_id)
-    if not vocabulary:
-        raise NotFound(f"Vocabulary: {vocabulary_id}")
-    table_name = vocabulary["name"][:-5]
+def _list_vocabulary(
+    vocabulary_id, limit, cursor, version=None, **params
+) -> Tuple[Dict, Iterable]:
+    """Return a page of entries ordered by key.
 
-    query = (
-        f"""SELECT * FROM "{table_name}"
-        WHERE key >= ?
-        LIMIT {limit}""",
-        (cursor,),
-    )
+    Pages are selected using the index on `key`: the cursor
+    carries the last key of the previous page, so that the
+    cost of a query does not depend on the page depth.
+    Since the cursor carries the version too, paging continues
+    on the same version even when a newer one is published.
+    """
+    current_app.logger.info(f"Params: {params}")
+    conditions, args = [], []
+    if cursor:
+        cursor_version, last_key = decode_cursor(cursor)
+        if version and version != cursor_version:
+            raise BadRequest(
+                f"Cursor refers to version {cursor_version} of {vocabulary_id},"
+                f" while version {version} was requested."
+            )
+        try:
+            vocabulary = get_version(vocabulary_id, cursor_version)
+        except NotFound:
+            raise BadRequest(
+                f"Cursor refers to version {cursor_version} of {vocabulary_id},"
+                " which is no longer available."
+            )
+        conditions.append("key > ?")
+        args.append(last_key)
+    else:
+        vocabulary = get_version(vocabulary_id, version)
+    table_name = vocabulary["table"]
 
     label_param = list(set(params) & {"label_it", "label_en"})[0:1]
     if label_param:
         label_param = label_param[0]
-        query = (
-            f"""SELECT * FROM "{table_name}"
-        WHERE key >= ?
-        AND {label_param} LIKE ?
-        LIMIT {limit}""",
-            (cursor, params[label_param]),
-        )
+        conditions.append(f"{label_param} LIKE ?")
+        args.append(params[label_param])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = (
+        f"""SELECT * FROM "{table_name}"
+        {where}
+        ORDER BY key
+        LIMIT {int(limit)}""",
+        tuple(args),
+    )
 
     entries = sql_execute(*query)
     # Format entries as dictionaries.
-    entries.cursor.row_factory = sqlite3.Row
-    ret = entries.cursor.fetchall()
+    ret = entries.fetchall()
     ret = (dict(x) for x in ret) if ret else []
     return vocabulary, ret
 
 
-def test_list_entries():
-    ret = list_entries("countries", 10)
-    assert len(ret["entries"]) == 10
-
-
-def get_entry(vocabulary_id, entry_id, format="json"):
-    vocabulary = last_version(vocabulary_id)
-    if not vocabulary:
-        raise NotFound(f"Vocabulary: {vocabulary_id}")
-    table_name = vocabulary["name"][:-5]
+def get_entry(vocabulary_id, entry_id, format="json", version=None):
+    vocabulary = get_version(vocabulary_id, version)
+    table_name = vocabulary["table"]
 
-    entries = current_app.config["db"].execute(
+    entries = sql_execute(
         f"""SELECT * FROM '{table_name}' WHERE key = ?""", (entry_id,)
     )
 
-    entries.cursor.row_factory = sqlite3.Row
-    ret = entries.cursor.fetchone()
+    ret = entries.fetchone()
     if not ret:
         raise NotFound
 
     res = dict(ret)
-    headers = {"Content-Type": "application/json", "cache-control": "max-age=36000"}
+    headers = {
+        "Content-Type": "application/json",
+        "cache-control": cache_control(version),
+    }
 
-    if request.headers.get("Accept") == "application/ld+json" or format == "jsonld":
-        ctx = vocabulary.get("context", "{}")
-        res["@context"] = yaml.safe_load(ctx)
-        headers.update({"Content-Type": "application/ld+json"})
+    if request.headers.get("Accept") == MIME_JSONLD or format == "jsonld":
+        return jsonld_response(res, vocabulary, headers)
     # import pdb; pdb.set_trace()
     return res, 200, headers
 
 
-def test_get_entry():
-    ret = get_entry("countries", "ITA")
-    assert ret.get("label_en") == "Italy"
+HIERARCHY_JOINS = {
+    # Return the descendants of the given entry.
+    "descendant": ("ancestor", "descendant"),
+    # Return the ancestors of the given entry.
+    "ancestor": ("descendant", "ancestor"),
+}
+
+
+def _hierarchy(vocabulary_id, entry_id, version, relation, max_depth=None):
+    """Return the entries related to `entry_id` through the closure table,
+    using a single indexed query.
+
+    :raises NotFound: if the entry does not exist.
+    """
+    vocabulary = get_version(vocabulary_id, version)
+    table_name = vocabulary["table"]
+
+    ret = []
+    if vocabulary["closure"]:
+        column, related = HIERARCHY_JOINS[relation]
+        depth = "AND c.depth <= ?" if max_depth else ""
+        entries = sql_execute(
+            f"""SELECT e.*, c.depth FROM "{vocabulary['closure']}" c
+            JOIN "{table_name}" e ON e.key = c.{related}
+            WHERE c.{column} = ? {depth}
+            ORDER BY c.depth, e.key""",
+            (entry_id, max_depth) if max_depth else (entry_id,),
+        )
+        ret = [dict(entry) for entry in entries]
+    if (
+        not ret
+        and not sql_execute(
+            f"""SELECT 1 FROM "{table_name}" WHERE key = ?""", (entry_id,)
+        ).fetchone()
+    ):
+        raise NotFound
+
+    ret = {"count": len(ret), "version": vocabulary["version"], "entries": ret}
+    headers = {
+        "Content-Type": "application/json",
+        "cache-control": cache_control(version),
+    }
+    if request.headers.get("Accept") == MIME_JSONLD:
+        return jsonld_response(ret, vocabulary, headers)
+    return ret, 200, headers
+
+
+def get_children(vocabulary_id, entry_id, version=None):
+    return _hierarchy(vocabulary_id, entry_id, version, "descendant", max_depth=1)
+
+
+def get_ancestors(vocabulary_id, entry_id, version=None):
+    return _hierarchy(vocabulary_id, entry_id, version, "ancestor")
+
+
+def get_descendants(vocabulary_id, entry_id, version=None, max_depth=None):
+    return _hierarchy(vocabulary_id, entry_id, version, "descendant", max_depth)
+
+
+def autocomplete(vocabulary_id, q, limit=10, lang=None, version=None):
+    """Return the entries with a label starting with `q`,
+    using the prefix index built when the catalog was loaded."""
+    vocabulary = get_version(vocabulary_id, version)
+    fields = [f"label_{lang}"] if lang else None
+    entries = vocabulary["labels"].search(q, limit=limit, fields=fields)
+    ret = {"count": len(entries), "version": vocabulary["version"], "entries": entries}
+    headers = {
+        "Content-Type": "application/json",
+        "cache-control": cache_control(version),
+    }
+    return ret, 200, headers
+
+
+def resolve_uri(uri, redirect=False):
+    """Find the entry identified by `uri` in any vocabulary
+    using the global uri index.
+
+    When the uri belongs to many vocabulary versions,
+    the latest one is preferred.
+    """
+    catalog = get_catalog()
+    try:
+        rows = sql_execute(
+            f"""SELECT vocabulary, version, key FROM {URI_INDEX_TABLE}
+            WHERE url = ?""",
+            (uri,),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # Datastores built without urls have no index.
+        if sql_execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (URI_INDEX_TABLE,),
+        ).fetchone():
+            raise
+        raise NotFound(f"URI: {uri}")
+    matches = [
+        (catalog[m["vocabulary"]]["versions"][m["version"]], m["key"])
+        for m in rows
+        if m["version"] in catalog.get(m["vocabulary"], {}).get("versions", ())
+    ]
+    if not matches:
+        raise NotFound(f"URI: {uri}")
+    vocabulary, key = max(
+        matches,
+        key=lambda m: (
+            m[0] is catalog[m[0]["name"]]["latest"],
+            m[0]["version_key"],
+            m[0]["name"],
+        ),
+    )
+
+    is_latest = vocabulary is catalog[vocabulary["name"]]["latest"]
+    href = urljoin(
+        request.base_url, f"vocabularies/{vocabulary['name']}/{quote(str(key))}"
+    )
+    if not is_latest:
+        href = update_url(href, {"version": vocabulary["version"]})
+    if redirect:
+        return Response(status=303, headers={"Location": href})
+
+    entry = sql_execute(
+        f"""SELECT * FROM "{vocabulary['table']}" WHERE key = ?""", (key,)
+    ).fetchone()
+    ret = {
+        "vocabulary": vocabulary["name"],
+        "version": vocabulary["version"],
+        "href": href,
+        "entry": dict(entry),
+    }
+    headers = {"Content-Type": "application/json", "cache-control": cache_control()}
+    return ret, 200, headers
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BATCH_SIZE = 500
+
+
+def _export_rows(entries: sqlite3.Cursor, format: str) -> Iterable[str]:
+    """Serialize the rows of a cursor in batches of EXPORT_BATCH_SIZE,
+    so that only one batch at a time is held in memory.
+    """
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column for column, *_ in entries.description])
+        while rows := entries.fetchmany(EXPORT_BATCH_SIZE):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        return
+
+    while rows := entries.fetchmany(EXPORT_BATCH_SIZE):
+        yield "".join(json.dumps(dict(row)) + "\n" for row in rows)
+
+
+def _gzip_chunks(chunks: Iterable[str]) -> Iterable[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if data := compressor.compress(chunk.encode()):
+            yield data
+    yield compressor.flush()
+
+
+def export_entries(vocabulary_id, format="ndjson", version=None):
+    """Stream all the entries of a vocabulary as NDJSON or CSV.
+
+    Rows are read from the SQLite cursor and sent using chunked
+    transfer encoding, so memory usage does not depend
+    on the vocabulary size. The body is gzip-compressed
+    when the client accepts it.
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise ValueError("Bad format")
+    vocabulary = get_version(vocabulary_id, version)
+    table_name = vocabulary["table"]
+
+    entries = sql_execute(f"""SELECT * FROM "{table_name}" ORDER BY key""")
+    body = _export_rows(entries, format)
+
+    headers = {
+        "cache-control": cache_control(version),
+        "Vary": "Accept-Encoding",
+        "X-Vocabulary-Version": vocabulary["version"],
+    }
+    if "gzip" in request.accept_encodings:
+        body = _gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(
+        stream_with_context(body),
+        status=200,
+        headers=headers,
+        mimetype=EXPORT_MEDIA_TYPES[format],
+    )
+
+
+# The default SQLITE_MAX_VARIABLE_NUMBER before SQLite 3.32.
+LOOKUP_MAX_ITEMS = 999
+
+
+def lookup_entries(vocabulary_id, body, version=None):
+    """Resolve many keys and/or urls of a vocabulary with a single query.
+
+    Entries are returned in request order, while the
+    keys and urls that did not match are listed in `missing`.
+    """
+    keys = list(dict.fromkeys(body.get("keys", [])))
+    urls = list(dict.fromkeys(body.get("urls", [])))
+    if len(keys) + len(urls) > LOOKUP_MAX_ITEMS:
+        raise BadRequest(f"Too many items: max {LOOKUP_MAX_ITEMS} keys and urls.")
+
+    vocabulary = get_version(vocabulary_id, version)
+    table_name = vocabulary["table"]
+
+    columns = [
+        c for (_, c, *_) in sql_execute(f"""PRAGMA table_info("{table_name}")""")
+    ]
+    # Vocabularies without urls only match keys.
+    match_urls = bool(urls) and "url" in columns
+    query = f"""SELECT * FROM "{table_name}"
+        WHERE key IN ({",".join("?" * len(keys))})"""
+    if match_urls:
+        query += f""" OR url IN ({",".join("?" * len(urls))})"""
+    entries = sql_execute(query, (*keys, *urls) if match_urls else tuple(keys))
+    by_key, by_url = {}, {}
+    for entry in entries:
+        entry = dict(entry)
+        by_key[entry["key"]] = entry
+        if match_urls:
+            by_url[entry["url"]] = entry
+
+    ret = [by_key[k] for k in keys if k in by_key] + [
+        by_url[u] for u in urls if u in by_url
+    ]
+    ret = {
+        "count": len(ret),
+        "version": vocabulary["version"],
+        "entries": ret,
+        "missing": {
+            "keys": [k for k in keys if k not in by_key],
+            "urls": [u for u in urls if u not in by_url],
+        },
+    }
+    headers = {"Content-Type": "application/json"}
+    if request.headers.get("Accept") == MIME_JSONLD:
+        return jsonld_response(ret, vocabulary, headers)
+
+    return ret, 200, headers
+
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_CACHE_SIZE = 4096
+# Supported encodings, in order of preference.
+COMPRESSORS = {}
+if brotli:
+    COMPRESSORS["br"] = lambda data: brotli.compress(data, quality=5)
+COMPRESSORS["gzip"] = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+# Suffixes for the ETag of the compressed representations.
+ETAG_SUFFIXES = {"gzip": "-gz", "br": "-br"}
+
+_compressed = OrderedDict()
+# Responses are served from a threadpool.
+_compressed_lock = threading.Lock()
+
+
+def _compress(etag: str, encoding: str, data: bytes) -> bytes:
+    """Compress `data`, caching the result by the ETag
+    of the uncompressed body and the encoding.
+
+    Only immutable responses are cached: they are served
+    over and over, and never change for a given version.
+    The data is compressed outside the lock, so concurrent
+    misses on the same key may compress it twice.
+    """
+    key = (etag, encoding)
+    with _compressed_lock:
+        ret = _compressed.get(key)
+        if ret is not None:
+            _compressed.move_to_end(key)
+    metrics.observe_cache("compressed", ret is not None)
+    if ret is not None:
+        return ret
+
+    ret = COMPRESSORS[encoding](data)
+    with _compressed_lock:
+        _compressed[key] = ret
+        while len(_compressed) > COMPRESS_CACHE_SIZE:
+            _compressed.popitem(last=False)
+    return ret
+
+
+def compress_response(response: Response) -> Response:
+    """Add an ETag to successful JSON responses,
+    and compress them using the best encoding accepted by the client.
+
+    The ETag is computed on the uncompressed body and
+    tagged with the encoding, so that each representation
+    has its own validator. Conditional requests are
+    answered with 304 before compressing.
+    """
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not response.is_json
+    ):
+        return response
+
+    data = response.get_data()
+    response.vary.add("Accept-Encoding")
+    encoding = None
+    if len(data) >= COMPRESS_MIN_SIZE:
+        encoding = request.accept_encodings.best_match(list(COMPRESSORS))
+
+    etag = hashlib.sha256(data).hexdigest()[:32]
+    response.set_etag(etag + ETAG_SUFFIXES.get(encoding, ""))
+    response.make_conditional(request)
+    if response.status_code != 200 or not encoding:
+        return response
+
+    if "immutable" in response.headers.get("Cache-Control", ""):
+        data = _compress(etag, encoding, data)
+    else:
+        data = COMPRESSORS[encoding](data)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    return response
 
 
 @click.command()
@@ -253,27 +960,57 @@ def test_get_entry():
 @click.option(
     "--dburl",
     help="Url to sqlite datafile",
-    default=os.environ.get("NDC_RESTAPI_DATASTORE_URL"),
+    default=os.environ.get(DATASTORE_URL_ENV),
 )
 @click.option("--port", default=8080, help="The port.")
-def main(dbpath, dburl, port):
-    zapp = connexion.FlaskApp(__name__, server="tornado")
-    CORS(zapp.app)
-
-    if not Path(f"/tmp/{dbpath}.db").exists() and dburl:
-        zapp.app.logger.info(f"Downloading database from {dburl}.")
-        Path(f"/tmp/{dbpath}.db").write_bytes(requests.get(dburl).content)
-        zapp.app.logger.warning(f"Database downloaded successfully from {dburl}.")
+@click.option("--host", default="0.0.0.0", help="The address to bind.")
+@click.option(
+    "--workers",
+    help="The number of worker processes. Send SIGHUP to reload them.",
+    default=int(os.environ.get("NDC_RESTAPI_WORKERS", 1)),
+)
+@click.option(
+    "--reload-interval",
+    help="Check DBURL for a new datastore every RELOAD_INTERVAL seconds."
+    " Send SIGUSR1 to a worker to check immediately. 0 disables reloading.",
+    default=int(os.environ.get(DATASTORE_RELOAD_INTERVAL_ENV, 0)),
+)
+def main(dbpath, dburl, port, host, workers, reload_interval):
+    dbfile = Path(f"/tmp/{dbpath}.db")
+
+    # Synchronize the datastore once, before starting the workers,
+    #  downloading only the tables that changed.
+    if dburl:
+        try:
+            sync_datastore(dburl, dbfile, src=dbfile)
+        except (requests.RequestException, ValueError) as e:
+            log.warning(f"Cannot synchronize database from {dburl}: {e}")
+            if not dbfile.exists():
+                log.info(f"Downloading database from {dburl}.")
+                # Its checksum is the one of the downloaded file.
+                manifest_path(dbfile).unlink(missing_ok=True)
+                download_file(dburl, dbfile)
+                log.warning(f"Database downloaded successfully from {dburl}.")
 
     # validate_db or die.
 
-    zapp.add_api("vocabularies.yaml", validate_responses=False)
-    zapp.app.config.update(
-        {"db": create_engine(f"sqlite:////tmp/{dbpath}.db", echo=True)}
+    # Workers create their own app, and then their own connections.
+    os.environ[DATASTORE_FILE_ENV] = dbfile.absolute().as_posix()
+    if workers > 1 and metrics.MULTIPROC_DIR_ENV not in os.environ:
+        # Aggregate the metrics of all the workers.
+        os.environ[metrics.MULTIPROC_DIR_ENV] = tempfile.mkdtemp(prefix="ndc-api-")
+    if dburl and reload_interval:
+        os.environ[DATASTORE_URL_ENV] = dburl
+        os.environ[DATASTORE_RELOAD_INTERVAL_ENV] = str(reload_interval)
+    uvicorn.run(
+        "api:create_app",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=30,
     )
 
-    zapp.run(port=port)
-
 
 if __name__ == "__main__":
     main()
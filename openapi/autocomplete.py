@@ -0,0 +1,95 @@
+"""
+In-memory prefix index of the vocabulary labels, used for autocompletion.
+
+Labels are normalized and stored in sorted arrays, so that
+the ones starting with a prefix are found with a binary search
+and the first `limit` matches are read in order,
+without scanning all the matching labels.
+
+Every label is indexed as a whole and from the start of each word,
+so that "emil" matches "Reggio nell'Emilia".
+Matches on the whole label are returned first.
+
+The index is built when the catalog of a datastore is loaded,
+so it is rebuilt only when the datastore is reloaded.
+"""
+
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+WORD_SEPARATOR = re.compile(r"\W+")
+LABEL_PREFIX = "label_"
+
+
+def normalize(text: str) -> str:
+    """Casefold `text`, strip accents and replace punctuation with spaces,
+    eg. "Forlì-Cesena" becomes "forli cesena"."""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(w for w in WORD_SEPARATOR.split(text) if w)
+
+
+class PrefixIndex:
+    def __init__(self, entries: Iterable[Tuple[str, str, str, str]]):
+        """Index the labels of a vocabulary version.
+
+        :param entries: (key, url, field, label) tuples,
+            where `field` is the column of the label, eg. `label_it`.
+        """
+        self.entries = []
+        labels, words = [], []
+        for key, url, field, label in entries:
+            term = normalize(label or "")
+            if not term:
+                continue
+            ref = len(self.entries)
+            self.entries.append((key, url, field, label))
+            labels.append((term, ref))
+            words += [
+                (term.split(" ", n)[n], ref) for n in range(1, term.count(" ") + 1)
+            ]
+
+        self.labels, self.label_refs = self._sorted(labels)
+        self.words, self.word_refs = self._sorted(words)
+
+    @staticmethod
+    def _sorted(terms: List[Tuple[str, int]]) -> Tuple[List[str], array]:
+        terms.sort()
+        return [t for t, _ in terms], array("I", (ref for _, ref in terms))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, prefix: str, limit: int = 10, fields=None) -> List[Dict]:
+        """Return at most `limit` entries with a label starting with `prefix`,
+        in alphabetical order.
+
+        :param fields: only match the labels in these columns.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        ret, seen = [], set()
+        for terms, refs in (
+            (self.labels, self.label_refs),
+            (self.words, self.word_refs),
+        ):
+            for i in range(bisect_left(terms, prefix), len(terms)):
+                if not terms[i].startswith(prefix):
+                    break
+                key, url, field, label = self.entries[refs[i]]
+                if key in seen or (fields and field not in fields):
+                    continue
+                seen.add(key)
+                ret.append({"key": key, "url": url, "field": field, "label": label})
+                if len(ret) == limit:
+                    return ret
+        return ret
+
+
+def label_fields(columns: Iterable[str]) -> List[str]:
+    return [c for c in columns if c.startswith(LABEL_PREFIX)]
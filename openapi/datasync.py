@@ -0,0 +1,406 @@
+"""
+Incremental synchronization of the API datastore.
+
+Besides `datastore.db`, the build publishes every vocabulary version
+(ie. a data table, its #meta table and its #closure table if any)
+in a separate SQLite file
+named after the checksum of its content,
+and a manifest listing them:
+
+    datastore.db
+    datastore.db.manifest.json
+    tables/2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae.db
+
+    {
+      "sha256": "6b86b273ff34fce19d6b804eff5a3f5747ada4eaa22f1d49c01e52ddb7875b4b",
+      "tables": {
+        "countries#20200630-0": {
+          "file": "tables/2c26b46b68ffc68f....db",
+          "sha256": "2c26b46b68ffc68f...",
+          "size": 8192
+        }
+      }
+    }
+
+The API downloads only the tables whose checksum differs
+from the ones of its local datastore, and copies the others.
+The global uri index is then rebuilt from the synchronized tables.
+The synchronized datastore is not identical to `datastore.db`:
+the manifest stores the checksum of the latter, to tell
+whether a datastore is up to date with the published one.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List
+from urllib.parse import urljoin
+
+import click
+import requests
+
+log = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+LOCK_SUFFIX = ".lock"
+TABLES_DIR = "tables"
+URI_INDEX_TABLE = "uri_index"
+# Published files change in place: never read them from an HTTP cache,
+#  eg. the one installed process-wide by requests_cache.
+NO_CACHE_HEADERS = {"Cache-Control": "no-store"}
+
+
+def manifest_path(dbfile: Path) -> Path:
+    return dbfile.with_name(dbfile.name + MANIFEST_SUFFIX)
+
+
+@contextmanager
+def sync_lock(dbfile: Path):
+    """Hold an exclusive lock on the datastores synchronized next to `dbfile`,
+    so that processes sharing them, eg. the API workers,
+    synchronize them one at a time instead of all downloading them.
+
+    The lock file is never removed: a process waiting on a removed file
+    would not exclude the ones creating a new one.
+    """
+    with open(dbfile.with_name(dbfile.name + LOCK_SUFFIX), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def hold_datastore(dbfile: Path):
+    """Open `dbfile` with a shared lock, so that other processes
+    do not remove it while it is in use.
+
+    :returns: the open file: the lock is released when it is closed.
+    """
+    fh = open(dbfile, "rb")
+    fcntl.flock(fh, fcntl.LOCK_SH)
+    return fh
+
+
+def remove_datastore(dbfile: Path) -> bool:
+    """Remove `dbfile` and its manifest, unless a process holds it.
+
+    :returns: True if it was removed.
+    """
+    try:
+        fh = open(dbfile, "rb")
+    except FileNotFoundError:
+        return False
+    with fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        manifest_path(dbfile).unlink(missing_ok=True)
+        dbfile.unlink()
+    return True
+
+
+def file_checksum(fpath: Path) -> str:
+    digest = hashlib.sha256()
+    with Path(fpath).open("rb") as fh:
+        while chunk := fh.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def published_checksum(dbfile: Path) -> str:
+    """Return the checksum of the published datastore
+    that `dbfile` was synchronized from, as listed in its manifest,
+    or the one of `dbfile` if it was downloaded.
+    """
+    if manifest_path(dbfile).exists():
+        manifest = json.loads(manifest_path(dbfile).read_text())
+        if "sha256" in manifest:
+            return manifest["sha256"]
+    return file_checksum(dbfile)
+
+
+def list_tables(db: sqlite3.Connection) -> List[str]:
+    """Return the data tables, ie. the ones with a #meta table."""
+    return [
+        name[:-5]
+        for (name,) in db.execute(
+            """SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name LIKE '%#meta'
+            ORDER BY name"""
+        )
+    ]
+
+
+def _table_group(db: sqlite3.Connection, table: str, schema: str = "main") -> List[str]:
+    """Return a data table and its companion tables in `schema`."""
+    names = [table, f"{table}#meta"]
+    closure = f"{table}#closure"
+    if db.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+        (closure,),
+    ).fetchone():
+        names.append(closure)
+    return names
+
+
+def _schema(db: sqlite3.Connection, table: str, schema: str = "main") -> List[str]:
+    """Return the statements creating a table and then its indexes."""
+    return [
+        sql
+        for (sql,) in db.execute(
+            f"""SELECT sql FROM {schema}.sqlite_master
+            WHERE tbl_name = ? AND sql IS NOT NULL
+            ORDER BY type DESC, name""",
+            (table,),
+        )
+    ]
+
+
+def table_checksum(db: sqlite3.Connection, table: str) -> str:
+    """Return the sha256 of the schema and the rows
+    of a data table and of its companion tables.
+
+    It only depends on the content, so it does not change
+    when the same table is rebuilt.
+    """
+    digest = hashlib.sha256()
+    for name in _table_group(db, table):
+        for sql in _schema(db, name):
+            digest.update(sql.encode())
+        for row in db.execute(f"""SELECT * FROM "{name}" ORDER BY rowid"""):
+            digest.update(json.dumps(row).encode())
+    return digest.hexdigest()
+
+
+def copy_tables(db: sqlite3.Connection, src: Path, tables: Iterable[str]):
+    """Copy data tables and their companion tables from `src` into `db`,
+    together with their indexes."""
+    db.execute("ATTACH DATABASE ? AS src", (Path(src).as_posix(),))
+    try:
+        for table in tables:
+            for name in _table_group(db, table, schema="src"):
+                create_table, *create_indexes = _schema(db, name, schema="src")
+                db.execute(create_table)
+                db.execute(f"""INSERT INTO main."{name}" SELECT * FROM src."{name}" """)
+                for sql in create_indexes:
+                    db.execute(sql)
+        db.commit()
+    finally:
+        db.execute("DETACH DATABASE src")
+
+
+def index_uris(db: sqlite3.Connection):
+    """Rebuild the global uri index from the data tables having an url column.
+
+    The builder runs it once all the tables are written,
+    and the API once they are synchronized.
+    """
+    db.execute(f"DROP TABLE IF EXISTS {URI_INDEX_TABLE}")
+    db.execute(
+        f"""CREATE TABLE {URI_INDEX_TABLE}
+        (url TEXT NOT NULL, vocabulary TEXT NOT NULL, version TEXT NOT NULL, key)"""
+    )
+    for table in list_tables(db):
+        columns = {c for (_, c, *_) in db.execute(f"""PRAGMA table_info("{table}")""")}
+        if "url" not in columns:
+            continue
+        name, version = db.execute(
+            f"""SELECT name, version FROM "{table}#meta" """
+        ).fetchone()
+        db.execute(
+            f"""INSERT INTO {URI_INDEX_TABLE} (url, vocabulary, version, key)
+            SELECT url, ?, ?, key FROM "{table}" WHERE url IS NOT NULL""",
+            (name, version),
+        )
+    db.execute(f"CREATE INDEX ix_{URI_INDEX_TABLE}_url ON {URI_INDEX_TABLE} (url)")
+    db.commit()
+
+
+def publish_tables(dbfile: Path, dest_dir: Path = None) -> Dict:
+    """Write one file per table of `dbfile` into `dest_dir`,
+    together with the manifest.
+
+    :returns: the manifest.
+    """
+    dest_dir = dest_dir or dbfile.parent
+    (dest_dir / TABLES_DIR).mkdir(exist_ok=True, parents=True)
+    db = sqlite3.connect(dbfile)
+    manifest = {"sha256": file_checksum(dbfile), "tables": {}}
+    for table in list_tables(db):
+        checksum = table_checksum(db, table)
+        fpath = Path(TABLES_DIR) / f"{checksum}.db"
+        if not (dest_dir / fpath).exists():
+            tmpfile = dest_dir / fpath.with_suffix(".tmp")
+            tmpfile.unlink(missing_ok=True)
+            with sqlite3.connect(tmpfile) as table_db:
+                copy_tables(table_db, dbfile, [table])
+            table_db.close()
+            os.replace(tmpfile, dest_dir / fpath)
+        manifest["tables"][table] = {
+            "file": fpath.as_posix(),
+            "sha256": checksum,
+            "size": (dest_dir / fpath).stat().st_size,
+        }
+    db.close()
+
+    manifest_path(dest_dir / dbfile.name).write_text(
+        json.dumps(manifest, indent=2, sort_keys=True)
+    )
+    return manifest
+
+
+def download_file(url: str, dpath: Path, checksum: str = None) -> str:
+    """Download `url` into `dpath`.
+
+    The file is streamed into a temporary file in the same directory,
+    verified against `checksum` if any and then atomically renamed,
+    so that `dpath` is either missing or complete.
+
+    :returns: the sha256 of the file.
+    :raises ValueError: if the checksum does not match.
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(
+        dir=dpath.parent, prefix=dpath.name, suffix=".tmp", delete=False
+    ) as fh, requests.get(
+        url, stream=True, timeout=30, headers=NO_CACHE_HEADERS
+    ) as res:
+        tmpfile = Path(fh.name)
+        try:
+            res.raise_for_status()
+            for chunk in res.iter_content(chunk_size=1 << 20):
+                fh.write(chunk)
+                digest.update(chunk)
+        except Exception:
+            tmpfile.unlink()
+            raise
+
+    if checksum and digest.hexdigest() != checksum:
+        tmpfile.unlink()
+        raise ValueError(f"Checksum mismatch for {url}: {digest.hexdigest()}")
+    os.replace(tmpfile, dpath)
+    return digest.hexdigest()
+
+
+def local_checksums(src: Path) -> Dict[str, str]:
+    """Return the checksums of the tables in `src`,
+    reading them from its manifest when available."""
+    if not src or not src.exists():
+        return {}
+    if manifest_path(src).exists():
+        manifest = json.loads(manifest_path(src).read_text())
+        return {k: v["sha256"] for k, v in manifest["tables"].items()}
+
+    db = sqlite3.connect(f"file:{src.absolute()}?mode=ro", uri=True)
+    try:
+        return {table: table_checksum(db, table) for table in list_tables(db)}
+    finally:
+        db.close()
+
+
+def sync_datastore(url: str, dest: Path, src: Path = None) -> Dict[str, int]:
+    """Create `dest` with the tables listed in the manifest published
+    alongside the datastore at `url`.
+
+    Tables whose checksum matches the ones in `src`
+    are copied from there, while the others are downloaded.
+    `dest` is atomically replaced, so it can be the same as `src`,
+    unless its manifest already matches the published one.
+
+    :returns: the number of copied and downloaded tables.
+    :raises requests.HTTPError: if the manifest is not published.
+    :raises ValueError: if a downloaded table does not match its checksum.
+    """
+    res = requests.get(url + MANIFEST_SUFFIX, timeout=30, headers=NO_CACHE_HEADERS)
+    res.raise_for_status()
+    manifest = res.json()
+
+    if dest.exists() and manifest_path(dest).exists():
+        if json.loads(manifest_path(dest).read_text())["tables"] == manifest["tables"]:
+            log.info(f"Datastore {dest} is up to date with {url}.")
+            # The published datastore may differ, eg. by its page layout.
+            manifest_path(dest).write_text(
+                json.dumps(manifest, indent=2, sort_keys=True)
+            )
+            return {"copied": 0, "downloaded": 0}
+
+    local = local_checksums(src)
+    copy = [t for t, v in manifest["tables"].items() if local.get(t) == v["sha256"]]
+    fetch = [t for t in manifest["tables"] if t not in copy]
+
+    with tempfile.NamedTemporaryFile(
+        dir=dest.parent, prefix=dest.name, suffix=".tmp", delete=False
+    ) as fh:
+        tmpfile = Path(fh.name)
+    db = sqlite3.connect(tmpfile)
+    try:
+        if copy:
+            copy_tables(db, src, copy)
+        for table in fetch:
+            entry = manifest["tables"][table]
+            with tempfile.NamedTemporaryFile(
+                dir=dest.parent, prefix=dest.name, suffix=".tmp", delete=False
+            ) as fh:
+                table_file = Path(fh.name)
+            log.info(f"Downloading table {table} from {entry['file']}.")
+            download_file(urljoin(url, entry["file"]), table_file)
+            try:
+                with sqlite3.connect(table_file) as table_db:
+                    checksum = table_checksum(table_db, table)
+                table_db.close()
+                if checksum != entry["sha256"]:
+                    raise ValueError(f"Checksum mismatch for table {table}: {checksum}")
+                copy_tables(db, table_file, [table])
+            finally:
+                table_file.unlink()
+        index_uris(db)
+        db.close()
+    except Exception:
+        db.close()
+        tmpfile.unlink()
+        raise
+
+    # Never leave a manifest that does not describe `dest`.
+    manifest_path(dest).unlink(missing_ok=True)
+    os.replace(tmpfile, dest)
+    manifest_path(dest).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    log.info(
+        f"Synchronized {dest}: {len(copy)} tables copied, {len(fetch)} downloaded."
+    )
+    return {"copied": len(copy), "downloaded": len(fetch)}
+
+
+@click.group()
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+
+@main.command()
+@click.argument("dbfile", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def index(dbfile):
+    """Rebuild the global uri index of DBFILE, once all its tables are written."""
+    db = sqlite3.connect(dbfile)
+    try:
+        index_uris(db)
+    finally:
+        db.close()
+
+
+@main.command()
+@click.argument("dbfile", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def publish(dbfile):
+    """Publish the tables of DBFILE and their manifest next to it."""
+    manifest = publish_tables(dbfile)
+    log.warning(f"Published {len(manifest['tables'])} datastore tables.")
+
+
+if __name__ == "__main__":
+    main()
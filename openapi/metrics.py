@@ -0,0 +1,118 @@
+"""
+Prometheus metrics of the vocabularies API.
+
+Metrics are exposed in the text format on /metrics.
+When the API is served by many worker processes,
+set PROMETHEUS_MULTIPROC_DIR to an empty directory
+so that the values of all the workers are aggregated.
+The gauges of a worker are removed when it exits.
+"""
+
+import atexit
+import os
+import time
+from pathlib import Path
+from typing import Dict
+
+from flask import Flask, Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+REQUESTS = Counter(
+    "ndc_api_requests_total",
+    "Number of requests.",
+    ["route", "method", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "ndc_api_request_duration_seconds",
+    "Time spent processing requests, until the first byte of the body.",
+    ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+QUERY_DURATION = Histogram(
+    "ndc_api_query_duration_seconds",
+    "Time spent executing SQLite statements.",
+    ["statement"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.25),
+)
+CACHE_REQUESTS = Counter(
+    "ndc_api_cache_requests_total",
+    "Number of cache lookups: the hit ratio is hit / (hit + miss).",
+    ["cache", "result"],
+)
+DATASTORE_SIZE = Gauge(
+    "ndc_api_datastore_size_bytes",
+    "Size of the datastore file.",
+    multiprocess_mode="livemax",
+)
+VOCABULARY_VERSION = Gauge(
+    "ndc_api_vocabulary_version_info",
+    "Latest version of each vocabulary in the datastore.",
+    ["vocabulary", "version"],
+    multiprocess_mode="livemax",
+)
+
+
+def observe_query(statement: str, duration: float):
+    """Record the duration of a statement labeled by its first keyword."""
+    QUERY_DURATION.labels(statement.split(None, 1)[0].upper()).observe(duration)
+
+
+def observe_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_datastore(dbfile: Path, catalog: Dict[str, Dict], previous=None):
+    """Expose the size and the latest vocabulary versions of a datastore,
+    resetting the ones of the `previous` catalog."""
+    DATASTORE_SIZE.set(Path(dbfile).stat().st_size)
+    for name, vocabulary in (previous or {}).items():
+        VOCABULARY_VERSION.labels(name, vocabulary["latest"]["version"]).set(0)
+    for name, vocabulary in catalog.items():
+        VOCABULARY_VERSION.labels(name, vocabulary["latest"]["version"]).set(1)
+
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+def _observe_request(response: Response) -> Response:
+    # Use the route rule instead of the path to bound the label cardinality.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    if "request_start" in g:
+        REQUEST_DURATION.labels(route).observe(time.perf_counter() - g.request_start)
+    return response
+
+
+def get_metrics() -> Response:
+    if MULTIPROC_DIR_ENV in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+    else:
+        data = generate_latest()
+    return Response(data, content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app: Flask):
+    """Measure the requests served by `app`, and expose the metrics on /metrics.
+
+    The request hook is registered first, so that
+    it runs after all the other after_request functions.
+    """
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+    app.add_url_rule("/metrics", "metrics", get_metrics)
+    if MULTIPROC_DIR_ENV in os.environ:
+        # Otherwise the live gauges of restarted workers are never removed.
+        atexit.register(multiprocess.mark_process_dead, os.getpid())
@@ -0,0 +1,186 @@
+"""
+Render a static snapshot of the vocabularies API.
+
+Responses are produced by the same functions and serializer
+used by api.py, so they are byte-identical to the live ones
+and can be served by any static file server or CDN.
+
+Every response is stored in a file whose path is the request path
+relative to the API base url, and whose name is the query string
+(or `index` when there is no query string) followed
+by a suffix depending on the media type,
+together with its gzip-compressed version, eg.
+
+    vocabularies/index.json
+    vocabularies/countries/index.json
+    vocabularies/countries/cursor=WyIyMDIw...%3D.json
+    vocabularies/countries/ITA/index.jsonld
+    vocabularies-schema/countries/lang=en&schema_type=enum.json.gz
+
+Entry keys are percent-encoded, including slashes,
+so that each one is a single path segment.
+Query parameters are sorted alphabetically. An nginx
+configuration serving the snapshot could be
+(nginx decodes $uri, so it does not serve keys with reserved characters)
+
+    map $args $snapshot_query { "" index; default $args; }
+    map $http_accept $snapshot_suffix { application/ld+json .jsonld; default .json; }
+    location /vocabularies/v1/ {
+        gzip_static on;
+        alias /srv/api/;
+        try_files $uri/$snapshot_query$snapshot_suffix =404;
+    }
+"""
+
+import gzip
+import logging
+from pathlib import Path
+from typing import Callable, Dict
+from urllib.parse import quote, urlencode, urlsplit
+
+import api
+import click
+import flask
+from connexion.jsonifier import Jsonifier
+from flask import Flask, Response
+
+log = logging.getLogger(__name__)
+
+MIME_JSON = "application/json"
+MIME_JSONLD = "application/ld+json"
+MEDIA_SUFFIXES = {MIME_JSON: ".json", MIME_JSONLD: ".jsonld"}
+SCHEMA_LANGS = ("it", "en")
+SCHEMA_TYPES = ("oneOf", "oneOfenum", "anyOf", "anyOfenum", "enum", "enumUrl")
+
+
+def snapshot_path(url: str, base_url: str, media_type: str = MIME_JSON) -> Path:
+    """Return the path of the file storing the response to `url`."""
+    base_path = urlsplit(base_url).path.rstrip("/")
+    parts = urlsplit(url)
+    if not parts.path.startswith(base_path):
+        raise ValueError(f"{url} is not under {base_url}")
+    path = parts.path.replace(base_path, "", 1).strip("/")
+    query = parts.query or "index"
+    return Path(path) / (query + MEDIA_SUFFIXES[media_type])
+
+
+def write_response(dpath: Path, data: bytes):
+    dpath.parent.mkdir(exist_ok=True, parents=True)
+    dpath.write_bytes(data)
+    # Set mtime=0 to produce reproducible archives.
+    dpath.with_name(dpath.name + ".gz").write_bytes(
+        gzip.compress(data, compresslevel=9, mtime=0)
+    )
+
+
+class Snapshot:
+    def __init__(self, app: Flask, dest_dir: Path, base_url: str):
+        self.app = app
+        self.dest_dir = dest_dir
+        self.base_url = base_url.rstrip("/")
+        self.jsonifier = Jsonifier(flask.json, indent=2)
+        self.count = 0
+
+    def render(
+        self,
+        path: str,
+        handler: Callable,
+        *args,
+        query: Dict = None,
+        media_types=(MIME_JSON, MIME_JSONLD),
+        **kwargs,
+    ) -> Dict:
+        """Render the response of `handler` for each media type,
+        and return the body of the application/json one.
+        """
+        url = self.base_url + path
+        if query:
+            url += "?" + urlencode(sorted(query.items()))
+        ret = None
+        for media_type in media_types:
+            with self.app.test_request_context(url, headers={"Accept": media_type}):
+                body = handler(*args, **kwargs)
+            if isinstance(body, tuple):
+                body = body[0]
+            if isinstance(body, Response):
+                data = body.get_data()
+            else:
+                data = self.jsonifier.dumps(body).encode()
+            write_response(
+                self.dest_dir / snapshot_path(url, self.base_url, media_type), data
+            )
+            self.count += 1
+            ret = ret or body
+        return ret
+
+    def render_vocabulary(self, vocabulary_id: str):
+        path = f"/vocabularies/{vocabulary_id}"
+        cursor = None
+        while True:
+            query = {"cursor": cursor} if cursor else None
+            page = self.render(
+                path, api.list_entries, vocabulary_id, cursor=cursor or "", query=query
+            )
+            for entry in page["entries"]:
+                key = str(entry["key"])
+                if key in (".", ".."):
+                    log.warning(f"Skipping entry with unsafe key {key!r}.")
+                    continue
+                self.render(
+                    f"{path}/{quote(key, safe='')}", api.get_entry, vocabulary_id, key
+                )
+            cursor = page.get("cursor")
+            if not cursor:
+                break
+
+        path = f"/vocabularies-schema/{vocabulary_id}"
+        self.render(path, api.schema_list_entries_oneof, vocabulary_id)
+        for lang in SCHEMA_LANGS:
+            for schema_type in SCHEMA_TYPES:
+                self.render(
+                    path,
+                    api.schema_list_entries_oneof,
+                    vocabulary_id,
+                    lang=lang,
+                    schema_type=schema_type,
+                    query={"lang": lang, "schema_type": schema_type},
+                )
+
+
+def build_snapshot(dbfile: Path, dest_dir: Path, base_url: str) -> int:
+    """Render all the responses for the latest version
+    of every vocabulary in the datastore.
+
+    :returns: the number of rendered responses.
+    """
+    app = Flask(__name__)
+    app.config["db"] = api.connect_datastore(dbfile)
+    app.teardown_appcontext(api.close_db)
+
+    snapshot = Snapshot(app, dest_dir, base_url)
+    with app.app_context():
+        vocabularies = snapshot.render(
+            "/vocabularies", api.list_vocabularies, media_types=(MIME_JSON,)
+        )
+        for vocabulary in vocabularies["entries"]:
+            log.info(f"Rendering snapshot of {vocabulary['name']} in {dest_dir}.")
+            snapshot.render_vocabulary(vocabulary["name"])
+    return snapshot.count
+
+
+@click.command()
+@click.argument("dbfile", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("dest_dir", type=click.Path(file_okay=False, path_type=Path))
+@click.option(
+    "--base-url",
+    default="http://localhost:8080/vocabularies/v1",
+    help="The base url of the API, used in the links of the responses.",
+)
+def main(dbfile, dest_dir, base_url):
+    """Render the snapshot of the API serving DBFILE in DEST_DIR."""
+    count = build_snapshot(dbfile, dest_dir, base_url=base_url)
+    log.warning(f"Rendered {count} API responses in {dest_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Benchmark the vocabularies API.
+
+Start openapi/api.py on a datastore, replay a mix of requests
+ at a fixed concurrency and report throughput and latency percentiles
+ for each number of workers.
+
+Usage:
+
+  # Build the datastore from assets/vocabularies and benchmark it.
+  api-loadtest.py --build-datastore assets/vocabularies --output bench.json
+
+  # Check how the API scales with the number of workers.
+  api-loadtest.py --dbpath datastore --workers 1 2 4
+
+  # Compare with the results of another commit.
+  api-loadtest.py --compare baseline.json --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from multiprocessing import Pool
+from pathlib import Path
+from statistics import quantiles
+
+import requests
+
+log = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+basedir = Path(__file__).absolute().parent.parent
+SCHEMA_TYPES = ("oneOf", "anyOf", "enum")
+DEFAULT_MIX = "get_entry=70,list_entries=15,search=10,schema=5"
+
+
+def build_datastore(assets: Path, dbfile: Path):
+    """Build the datastore of the vocabularies in `assets` into `dbfile`."""
+    with tempfile.TemporaryDirectory() as buildpath:
+        # Semantic assets are built too, since they create the destination folders.
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "dati_playground",
+                "build",
+                assets.absolute().as_posix(),
+                buildpath,
+                "--build-semantic",
+                "true",
+                "--build-csv",
+                "true",
+            ],
+            cwd=buildpath,
+            env=dict(os.environ, PYTHONPATH=basedir.as_posix()),
+            check=True,
+        )
+        shutil.copy(Path(buildpath) / "datastore.db", dbfile)
+
+
+def sample_entries(dbfile: Path, size=1000):
+    """Return (vocabulary, key, label) tuples sampled from the datastore."""
+    db = sqlite3.connect(f"file:{dbfile}?mode=ro", uri=True)
+    tables = [
+        name[:-5]
+        for (name,) in db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%#meta'"
+        )
+    ]
+    entries = []
+    for table in tables:
+        vocabulary = table.split("#")[0]
+        columns = [c for (_, c, *_) in db.execute(f'PRAGMA table_info("{table}")')]
+        label = "label_it" if "label_it" in columns else "key"
+        entries += [
+            (vocabulary, key, text)
+            for (key, text) in db.execute(
+                f'SELECT key, {label} FROM "{table}" LIMIT {size}'
+            )
+        ]
+    return random.sample(entries, min(size, len(entries)))
+
+
+def parse_mix(mix: str):
+    ret = {}
+    for item in mix.split(","):
+        op, weight = item.split("=")
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation {op}: use one of {list(OPERATIONS)}")
+        ret[op] = float(weight)
+    return ret
+
+
+def get_entry(session, base_url, entry, cursors):
+    vocabulary, key, _ = entry
+    return session.get(f"{base_url}/vocabularies/{vocabulary}/{key}")
+
+
+def list_entries(session, base_url, entry, cursors):
+    """Get the next page of a vocabulary, restarting when the last one is reached."""
+    vocabulary = entry[0]
+    url = cursors.get(vocabulary) or f"{base_url}/vocabularies/{vocabulary}?limit=100"
+    res = session.get(url)
+    cursors[vocabulary] = res.ok and res.json().get("url")
+    return res
+
+
+def search(session, base_url, entry, cursors):
+    vocabulary, key, label = entry
+    prefix = re.sub(r"[^a-zA-Z0-9]", "", str(label or key))[:3]
+    return session.get(
+        f"{base_url}/vocabularies/{vocabulary}", params={"label_it": f"{prefix}%"}
+    )
+
+
+def autocomplete(session, base_url, entry, cursors):
+    vocabulary, key, label = entry
+    text = str(label or key)
+    return session.get(
+        f"{base_url}/vocabularies-autocomplete/{vocabulary}",
+        params={"q": text[: random.randint(1, 4)]},
+    )
+
+
+def schema(session, base_url, entry, cursors):
+    return session.get(
+        f"{base_url}/vocabularies-schema/{entry[0]}",
+        params={"schema_type": random.choice(SCHEMA_TYPES)},
+    )
+
+
+OPERATIONS = {
+    "get_entry": get_entry,
+    "list_entries": list_entries,
+    "search": search,
+    "autocomplete": autocomplete,
+    "schema": schema,
+}
+
+
+def client(args):
+    """Replay requests until the deadline,
+    returning the latency in seconds of each one."""
+    base_url, entries, mix, duration, seed = args
+    random.seed(seed)
+    session = requests.Session()
+    ops, weights = list(mix), list(mix.values())
+    cursors = {}
+    results = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        op = random.choices(ops, weights)[0]
+        start = time.perf_counter()
+        res = OPERATIONS[op](session, base_url, random.choice(entries), cursors)
+        results.append((op, time.perf_counter() - start, res.status_code == 200))
+    return results
+
+
+def wait_until_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/status", timeout=1).ok:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"API not ready at {base_url}")
+
+
+def summarize(results, duration):
+    latencies = sorted(latency for _, latency, _ in results)
+    if len(latencies) < 2:
+        latencies *= 2
+    p = quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(results),
+        "errors": sum(1 for *_, ok in results if not ok),
+        "rps": round(len(results) / duration, 1),
+        "p50_ms": round(p[49] * 1000, 2),
+        "p95_ms": round(p[94] * 1000, 2),
+        "p99_ms": round(p[98] * 1000, 2),
+    }
+
+
+def run(dbpath, workers, concurrency, duration, port, mix):
+    base_url = f"http://127.0.0.1:{port}/vocabularies/v1"
+    entries = sample_entries(Path(f"/tmp/{dbpath}.db"))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "api.py",
+            f"--dbpath={dbpath}",
+            f"--workers={workers}",
+            f"--port={port}",
+            "--host=127.0.0.1",
+        ],
+        cwd=basedir / "openapi",
+        env=dict(os.environ, NDC_RESTAPI_DATASTORE_URL=""),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url)
+        with Pool(processes=concurrency) as clients:
+            results = clients.map(
+                client,
+                [(base_url, entries, mix, duration, i) for i in range(concurrency)],
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = [r for client_results in results for r in client_results]
+    by_op = defaultdict(list)
+    for r in results:
+        by_op[r[0]].append(r)
+    return {
+        "workers": workers,
+        "total": summarize(results, duration),
+        "operations": {op: summarize(r, duration) for op, r in sorted(by_op.items())},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=basedir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report):
+    """Print the relative change of each metric with respect to `baseline`."""
+    runs = {r["workers"]: r for r in baseline["runs"]}
+    print("\nworkers\toperation\tmetric\tbaseline\tcurrent\tchange")
+    for run in report["runs"]:
+        if run["workers"] not in runs:
+            continue
+        old = runs[run["workers"]]
+        for op, current in [("total", run["total"]), *run["operations"].items()]:
+            before = old["total"] if op == "total" else old["operations"].get(op)
+            if not before:
+                continue
+            for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                change = (current[metric] - before[metric]) / (before[metric] or 1)
+                print(
+                    f"{run['workers']}\t{op}\t{metric}\t{before[metric]}"
+                    f"\t{current[metric]}\t{change:+.1%}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--dbpath", default="datastore", help="Uses /tmp/DBPATH.db")
+    parser.add_argument(
+        "--build-datastore",
+        type=Path,
+        metavar="ASSETS",
+        help="Build /tmp/DBPATH.db from the vocabularies in ASSETS, eg. assets/vocabularies.",
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--concurrency", type=int, default=2 * os.cpu_count())
+    parser.add_argument("--duration", type=int, default=10, help="Seconds per run.")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help=f"Weights of the requested operations. Default: {DEFAULT_MIX}",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to a JSON file.")
+    parser.add_argument("--compare", type=Path, help="A JSON file of a previous run.")
+    args = parser.parse_args()
+
+    if args.build_datastore:
+        build_datastore(args.build_datastore, Path(f"/tmp/{args.dbpath}.db"))
+
+    mix = parse_mix(args.mix)
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "mix": mix,
+        "runs": [],
+    }
+    print("workers\trps\tp50_ms\tp95_ms\tp99_ms\terrors")
+    for workers in args.workers:
+        result = run(
+            args.dbpath, workers, args.concurrency, args.duration, args.port, mix
+        )
+        report["runs"].append(result)
+        total = result["total"]
+        print(
+            f"{workers}\t{total['rps']}\t{total['p50_ms']}\t{total['p95_ms']}"
+            f"\t{total['p99_ms']}\t{total['errors']}"
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
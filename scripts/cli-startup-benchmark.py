@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+r"""
+Benchmark the startup time of the dati_playground CLI.
+
+Run `python -m dati_playground` once per subcommand and flag
+ on a minimal input, so that the wall time is dominated
+ by the interpreter startup and by the imports.
+
+Usage:
+
+  # Measure all the flags, and show the 5 slowest imports of each run.
+  cli-startup-benchmark.py --importtime 5
+
+  # Measure some flags, and compare with the results of another commit.
+  cli-startup-benchmark.py --flags validate_filename_format validate_shacl \
+      --compare baseline.json --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+
+log = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+basedir = Path(__file__).absolute().parent.parent
+sys.path.insert(0, basedir.as_posix())
+
+from dati_playground.__main__ import main  # noqa: E402
+
+# These flags need a built datastore.
+SKIP_FLAGS = ("build_api_snapshot", "build_datastore_manifest")
+# Run the CLI of this source tree, even if it is not installed.
+ENV = dict(os.environ, PYTHONPATH=basedir.as_posix())
+TURTLE = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<https://w3id.org/italia/controlled-vocabulary/sample> a skos:ConceptScheme .
+"""
+
+
+def commands(workdir: Path):
+    """Yield the (name, arguments) of the runs, one per flag."""
+    sample = workdir / "assets" / "vocabularies" / "sample" / "sample.ttl"
+    sample.parent.mkdir(parents=True)
+    sample.write_text(TURTLE)
+    (workdir / "empty").mkdir()
+    (workdir / "build").mkdir()
+
+    yield "python", ["-c", "pass"]
+    validate = ["validate", sample.as_posix(), "--no-cache", "--workers=1"]
+    build = ["build", (workdir / "empty").as_posix(), (workdir / "build").as_posix()]
+    yield "validate --all", ["-m", "dati_playground", *validate, "--all"]
+    for param in main.params:
+        if param.name in SKIP_FLAGS:
+            continue
+        option = f"{param.opts[0]}=true"
+        if param.name.startswith("validate_"):
+            yield f"validate {option}", ["-m", "dati_playground", *validate, option]
+        elif param.name.startswith("build_") or param.name == "validate":
+            yield f"build {option}", ["-m", "dati_playground", *build, option]
+
+
+def measure(args, repeat: int, cwd: Path) -> float:
+    """Return the median wall time of `repeat` runs, in milliseconds."""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = subprocess.run(
+            [sys.executable, *args], cwd=cwd, env=ENV, capture_output=True
+        )
+        elapsed.append(time.perf_counter() - start)
+        # Validation errors exit with 1, usage errors with 2.
+        if res.returncode > 1:
+            log.warning(f"{args} failed: {res.stderr.decode()[-1000:]}")
+    return round(median(elapsed) * 1000, 1)
+
+
+def slowest_imports(args, count: int, cwd: Path):
+    """Return the `count` top-level imports with the highest cumulative time."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        env=ENV,
+        capture_output=True,
+        text=True,
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented.
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports.append((int(cumulative) // 1000, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=basedir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report):
+    """Print the relative change of each run with respect to `baseline`."""
+    runs = baseline["runs"]
+    print("\ncommand\tbaseline_ms\tcurrent_ms\tchange")
+    for name, current in report["runs"].items():
+        if name not in runs:
+            continue
+        before = runs[name]
+        print(f"{name}\t{before}\t{current}\t{(current - before) / before:+.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command.")
+    parser.add_argument(
+        "--flags",
+        nargs="+",
+        help="Only measure these flags, eg. validate_shacl build_csv.",
+    )
+    parser.add_argument(
+        "--importtime",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Show the N slowest imports of each command.",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to a JSON file.")
+    parser.add_argument("--compare", type=Path, help="A JSON file of a previous run.")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "runs": {},
+    }
+    print("command\tmedian_ms")
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        for name, command in commands(workdir):
+            flag = name.split()[-1].lstrip("-").split("=")[0].replace("-", "_")
+            if args.flags and flag not in args.flags:
+                continue
+            report["runs"][name] = measure(command, args.repeat, workdir)
+            print(f"{name}\t{report['runs'][name]}")
+            if args.importtime:
+                for ms, module in slowest_imports(command, args.importtime, workdir):
+                    print(f"\t{ms} ms\t{module}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
@@ -0,0 +1,856 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from flask import Flask
+from jsonschema.exceptions import RefResolutionError
+from prometheus_client import REGISTRY
+from rdflib import Graph, URIRef
+from rdflib.namespace import SKOS
+
+from dati_playground.framing import df_to_sqlite, hierarchy_closure
+
+sys.path.insert(0, (Path(__file__).parent.parent / "openapi").as_posix())
+import api  # noqa: E402
+import autocomplete  # noqa: E402
+import datasync  # noqa: E402
+import metrics  # noqa: E402
+import snapshot  # noqa: E402
+
+CONTEXT = {
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "key": {"@id": "skos:notation"},
+    "label_it": {"@id": "skos:prefLabel", "@language": "it"},
+}
+COUNTRIES = [
+    ("ITA", "Italia", "Italy"),
+    ("FRA", "Francia", "France"),
+    ("DEU", "Germania", "Germany"),
+    ("ESP", "Spagna", "Spain"),
+    ("AUT", "Austria", "Austria"),
+]
+
+
+VERSIONS = {
+    # An older version with fewer entries.
+    "20190101-0": COUNTRIES[:3],
+    "20200630-0": COUNTRIES,
+}
+
+
+def make_datastore(dpath, versions=VERSIONS):
+    for version, countries in versions.items():
+        df = pd.DataFrame(
+            [
+                {
+                    "key": key,
+                    "url": f"https://w3id.org/italia/controlled-vocabulary/countries/{key}",
+                    "label_it": label_it,
+                    "label_en": label_en,
+                }
+                for key, label_it, label_en in countries
+            ]
+        ).set_index("key")
+        df_to_sqlite(
+            df,
+            dpath,
+            name="countries",
+            version=version,
+            url="https://w3id.org/italia/controlled-vocabulary/countries",
+            context=CONTEXT,
+        )
+    db = sqlite3.connect(dpath)
+    datasync.index_uris(db)
+    db.close()
+    return dpath
+
+
+def resolve_uri(dpath, url):
+    """Look up `url` in the uri index of a datastore."""
+    db = sqlite3.connect(dpath)
+    db.row_factory = sqlite3.Row
+    try:
+        return [
+            dict(row)
+            for row in db.execute(
+                f"""SELECT vocabulary, version, key FROM {datasync.URI_INDEX_TABLE}
+                WHERE url = ? ORDER BY vocabulary, version""",
+                (url,),
+            )
+        ]
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def datastore(tmp_path_factory):
+    return make_datastore(tmp_path_factory.mktemp("api") / "datastore.db")
+
+
+@pytest.fixture
+def app(datastore):
+    app = Flask(__name__)
+    app.config["db"] = api.connect_datastore(datastore)
+    app.teardown_appcontext(api.close_db)
+    return app
+
+
+@pytest.fixture
+def client(datastore):
+    """A client of the whole API, as served by the workers."""
+    client = api.create_app(datastore).test_client()
+    try:
+        # The specification is loaded by the first request.
+        client.get("/vocabularies/v1/status")
+    except RefResolutionError as e:
+        pytest.skip(f"Cannot resolve the remote definitions of the API: {e}")
+    return client
+
+
+def test_datastore_is_readonly(datastore):
+    db = api.connect_datastore(datastore).raw_connection()
+    assert db.execute("PRAGMA mmap_size").fetchone()[0] == api.DATASTORE_MMAP_SIZE
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute("CREATE TABLE foo (bar TEXT)")
+
+
+def test_warm_up(app, caplog):
+    with caplog.at_level("INFO"):
+        api.warm_up(app)
+    assert "is ready" in caplog.text
+
+
+def test_export_ndjson(app):
+    with app.test_request_context("/vocabularies-export/countries"):
+        response = api.export_entries("countries")
+        body = b"".join(response.iter_encoded()).decode()
+
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["X-Vocabulary-Version"] == "20200630-0"
+    entries = [json.loads(line) for line in body.splitlines()]
+    assert [e["key"] for e in entries] == sorted(k for k, *_ in COUNTRIES)
+
+
+def test_export_csv_gzip(app, monkeypatch):
+    monkeypatch.setattr(api, "EXPORT_BATCH_SIZE", 2)
+    with app.test_request_context(
+        "/vocabularies-export/countries?format=csv",
+        headers={"Accept-Encoding": "gzip"},
+    ):
+        response = api.export_entries("countries", format="csv")
+        chunks = list(response.iter_encoded())
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    rows = gzip.decompress(b"".join(chunks)).decode().splitlines()
+    assert rows[0] == "key,url,label_it,label_en"
+    assert len(rows) == len(COUNTRIES) + 1
+
+
+def test_export_not_found(app):
+    with app.test_request_context("/vocabularies-export/missing"):
+        with pytest.raises(api.NotFound):
+            api.export_entries("missing")
+
+
+def test_lookup_entries(app):
+    body = {
+        "keys": ["ITA", "XXX", "FRA", "ITA"],
+        "urls": ["https://w3id.org/italia/controlled-vocabulary/countries/ESP"],
+    }
+    with app.test_request_context("/vocabularies-lookup/countries", method="POST"):
+        ret, status, _ = api.lookup_entries("countries", body)
+
+    assert status == 200
+    assert [e["key"] for e in ret["entries"]] == ["ITA", "FRA", "ESP"]
+    assert ret["missing"] == {"keys": ["XXX"], "urls": []}
+
+
+def test_lookup_entries_without_urls(tmp_path):
+    dpath = tmp_path / "datastore.db"
+    df = pd.DataFrame([{"key": "ITA", "label_it": "Italia"}]).set_index("key")
+    df_to_sqlite(df, dpath, name="countries", version="20200630-0")
+    app = Flask(__name__)
+    app.config["db"] = api.connect_datastore(dpath)
+
+    body = {"keys": ["ITA"], "urls": [COUNTRY_URL + "ITA"]}
+    with app.test_request_context("/vocabularies-lookup/countries", method="POST"):
+        ret, _, _ = api.lookup_entries("countries", body)
+        urls_only, _, _ = api.lookup_entries("countries", {"urls": body["urls"]})
+        # The datastore has no uri index.
+        with pytest.raises(api.NotFound):
+            api.resolve_uri(COUNTRY_URL + "ITA")
+
+    assert [e["key"] for e in ret["entries"]] == ["ITA"]
+    assert ret["missing"] == {"keys": [], "urls": body["urls"]}
+    assert urls_only["missing"] == {"keys": [], "urls": body["urls"]}
+
+
+def test_lookup_entries_too_many(app):
+    body = {"keys": [f"K{i}" for i in range(api.LOOKUP_MAX_ITEMS + 1)]}
+    with app.test_request_context("/vocabularies-lookup/countries", method="POST"):
+        with pytest.raises(api.BadRequest):
+            api.lookup_entries("countries", body)
+
+
+def test_list_entries_pagination(app):
+    keys, cursor = [], ""
+    while True:
+        with app.test_request_context("/vocabularies/countries"):
+            ret, _, _ = api.list_entries("countries", limit=2, cursor=cursor)
+        keys += [e["key"] for e in ret["entries"]]
+        if "cursor" not in ret:
+            break
+        cursor = ret["cursor"]
+
+    assert keys == sorted(k for k, *_ in COUNTRIES)
+
+
+def test_list_entries_label_pagination(app):
+    with app.test_request_context("/vocabularies/countries"):
+        ret, _, _ = api.list_entries("countries", limit=1, label_it="%ia")
+        assert [e["key"] for e in ret["entries"]] == ["AUT"]
+        ret, _, _ = api.list_entries(
+            "countries", limit=1, cursor=ret["cursor"], label_it="%ia"
+        )
+        assert [e["key"] for e in ret["entries"]] == ["DEU"]
+
+
+def test_list_entries_stale_cursor(app):
+    cursor = api.encode_cursor("20100101-0", "ITA")
+    with app.test_request_context("/vocabularies/countries"):
+        with pytest.raises(api.BadRequest):
+            api.list_entries("countries", cursor=cursor)
+
+
+def test_list_vocabularies(app):
+    with app.test_request_context("/vocabularies"):
+        ret = api.list_vocabularies()
+
+    (vocabulary,) = ret["entries"]
+    assert vocabulary["version"] == "20200630-0"
+    assert vocabulary["versions"] == ["20200630-0", "20190101-0"]
+
+
+def test_get_version(app):
+    with app.app_context():
+        assert api.get_version("countries")["version"] == "20200630-0"
+        assert api.get_version("countries", "20190101-0")["table"] == (
+            "countries#20190101-0"
+        )
+        with pytest.raises(api.NotFound):
+            api.get_version("countries", "20100101-0")
+        with pytest.raises(api.NotFound):
+            api.get_version("missing")
+
+
+def test_get_entry_pinned_version(app):
+    with app.test_request_context("/vocabularies/countries/AUT"):
+        ret, _, headers = api.get_entry("countries", "AUT")
+        assert ret["label_en"] == "Austria"
+        assert "immutable" not in headers["cache-control"]
+        with pytest.raises(api.NotFound):
+            api.get_entry("countries", "AUT", version="20190101-0")
+        ret, _, headers = api.get_entry("countries", "ITA", version="20190101-0")
+    assert ret["key"] == "ITA"
+    assert "immutable" in headers["cache-control"]
+
+
+def test_list_entries_cursor_pins_version(app):
+    with app.test_request_context("/vocabularies/countries"):
+        ret, _, _ = api.list_entries("countries", limit=1, version="20190101-0")
+        cursor = ret["cursor"]
+        # The cursor keeps paging on the same version.
+        ret, _, headers = api.list_entries("countries", limit=10, cursor=cursor)
+        assert ret["version"] == "20190101-0"
+        assert len(ret["entries"]) == len(VERSIONS["20190101-0"]) - 1
+        assert "immutable" in headers["cache-control"]
+        with pytest.raises(api.BadRequest):
+            api.list_entries("countries", cursor=cursor, version="20200630-0")
+
+
+def test_build_snapshot(datastore, tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "list_entries", partial(api.list_entries, limit=2))
+    base_url = "https://example.org/vocabularies/v1"
+    count = snapshot.build_snapshot(datastore, tmp_path, base_url)
+
+    index = json.loads((tmp_path / "vocabularies" / "index.json").read_text())
+    assert index["entries"][0]["href"] == f"{base_url}/vocabularies/countries"
+
+    # Follow the pagination links through the snapshot.
+    keys, url = [], f"{base_url}/vocabularies/countries"
+    while url:
+        page_path = tmp_path / snapshot.snapshot_path(url, base_url)
+        page = json.loads(page_path.read_text())
+        keys += [e["key"] for e in page["entries"]]
+        url = page.get("url")
+    assert keys == sorted(k for k, *_ in COUNTRIES)
+
+    entry = tmp_path / "vocabularies" / "countries" / "ITA" / "index.jsonld"
+    assert "@context" in json.loads(entry.read_text())
+    assert gzip.decompress(entry.with_suffix(".jsonld.gz").read_bytes()) == (
+        entry.read_bytes()
+    )
+    schema = (
+        tmp_path / "vocabularies-schema" / "countries" / "lang=en&schema_type=enum.json"
+    )
+    assert json.loads(schema.read_text())["SchemaVocabulary"]["enum"]
+    assert count == len(list(tmp_path.glob("**/*.json*"))) - len(
+        list(tmp_path.glob("**/*.gz"))
+    )
+
+
+def test_build_snapshot_unsafe_keys(tmp_path):
+    datastore = make_datastore(
+        tmp_path / "datastore.db",
+        {"20200630-0": [("A/B", "A", "A"), ("50%?", "B", "B"), ("..", "C", "C")]},
+    )
+    base_url = "https://example.org/vocabularies/v1"
+    snapshot.build_snapshot(datastore, tmp_path / "api", base_url)
+
+    entries = tmp_path / "api" / "vocabularies" / "countries"
+    assert sorted(f.name for f in entries.iterdir() if f.is_dir()) == [
+        "50%25%3F",
+        "A%2FB",
+    ]
+    url = f"{base_url}/vocabularies/countries/A%2FB"
+    entry = json.loads(
+        (tmp_path / "api" / snapshot.snapshot_path(url, base_url)).read_text()
+    )
+    assert entry["key"] == "A/B"
+
+
+def test_compress_response(app, monkeypatch):
+    monkeypatch.setattr(api, "COMPRESS_MIN_SIZE", 0)
+    monkeypatch.setattr(api, "_compressed", api.OrderedDict())
+
+    def get(headers):
+        with app.test_request_context("/vocabularies/countries", headers=headers):
+            ret, status, headers = api.list_entries("countries", version="20200630-0")
+            response = app.response_class(json.dumps(ret), status, headers)
+            return ret, api.compress_response(response)
+
+    ret, response = get({"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert json.loads(gzip.decompress(response.get_data())) == ret
+    etag, _ = response.get_etag()
+    assert etag.endswith("-gz")
+    assert len(api._compressed) == 1
+
+    # The cached representation is reused.
+    _, response = get({"Accept-Encoding": "gzip"})
+    assert response.get_etag() == (etag, False)
+    assert len(api._compressed) == 1
+
+    _, response = get({"Accept-Encoding": "gzip", "If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert "Content-Encoding" not in response.headers
+
+    _, response = get({})
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.get_data()) == ret
+
+
+def test_compress_threads(monkeypatch):
+    monkeypatch.setattr(api, "COMPRESS_CACHE_SIZE", 8)
+    monkeypatch.setattr(api, "_compressed", api.OrderedDict())
+    errors = []
+
+    def compress(n):
+        try:
+            for i in range(200):
+                data = f"{(n + i) % 16}".encode() * 100
+                ret = api._compress(f"etag-{(n + i) % 16}", "gzip", data)
+                assert gzip.decompress(ret) == data
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=compress, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(api._compressed) == 8
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serve the files in `tmp_path` over HTTP."""
+    handler = partial(SimpleHTTPRequestHandler, directory=tmp_path.as_posix())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_reload_datastore(app, datastore, tmp_path, http_server, monkeypatch):
+    published = make_datastore(
+        tmp_path / "datastore.db", dict(VERSIONS, **{"20210101-0": COUNTRIES})
+    )
+    checksum = hashlib.sha256(published.read_bytes()).hexdigest()
+    (tmp_path / "datastore.db.sha256").write_text(f"{checksum}  datastore.db\n")
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+    monkeypatch.setenv(api.DATASTORE_FILE_ENV, dbfile.as_posix())
+    url = f"{http_server}/datastore.db"
+
+    with app.test_request_context("/vocabularies/countries/ITA"):
+        # This request started before the reload.
+        assert api.get_version("countries")["version"] == "20200630-0"
+        assert api.reload_datastore(app, url)
+        assert api.get_version("countries")["version"] == "20200630-0"
+        assert api.get_entry("countries", "ITA")[0]["key"] == "ITA"
+
+    with app.test_request_context("/vocabularies/countries/ITA"):
+        assert api.get_version("countries")["version"] == "20210101-0"
+        ret, _, _ = api.get_entry("countries", "ITA")
+        assert ret["label_it"] == "Italia"
+
+    assert app.config["db_checksum"] == checksum
+    assert [f.name for f in dbfile.parent.glob("*.db")] == [
+        f"datastore-{checksum[:16]}.db"
+    ]
+    assert not list(dbfile.parent.glob("*.tmp"))
+    assert not api.reload_datastore(app, url)
+
+
+def test_reload_datastore_workers(datastore, tmp_path, http_server, monkeypatch):
+    published = make_datastore(
+        tmp_path / "datastore.db", dict(VERSIONS, **{"20210101-0": COUNTRIES})
+    )
+    checksum = hashlib.sha256(published.read_bytes()).hexdigest()
+    (tmp_path / "datastore.db.sha256").write_text(f"{checksum}  datastore.db\n")
+    datasync.publish_tables(published)
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+    monkeypatch.setenv(api.DATASTORE_FILE_ENV, dbfile.as_posix())
+    synced = []
+    sync = api.sync_datastore
+    monkeypatch.setattr(
+        api, "sync_datastore", lambda *a, **kw: synced.append(sync(*a, **kw))
+    )
+
+    # Each worker reloads its own engine from the same files.
+    apps = [Flask(__name__) for _ in range(3)]
+    for app in apps:
+        app.config["db"] = api.connect_datastore(datastore)
+    threads = [
+        threading.Thread(
+            target=api.reload_datastore, args=(app, f"{http_server}/datastore.db")
+        )
+        for app in apps
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert synced == [{"copied": 0, "downloaded": len(VERSIONS) + 1}]
+    assert [app.config.get("db_checksum") for app in apps] == [checksum] * len(apps)
+
+
+def publish(tmp_path, versions):
+    """Publish a datastore with its checksum and manifest."""
+    published = tmp_path / "datastore.db"
+    published.unlink(missing_ok=True)
+    make_datastore(published, versions)
+    checksum = hashlib.sha256(published.read_bytes()).hexdigest()
+    (tmp_path / "datastore.db.sha256").write_text(f"{checksum}  datastore.db\n")
+    datasync.publish_tables(published)
+    return checksum
+
+
+def test_reload_datastore_synchronized(tmp_path, http_server, monkeypatch):
+    url = f"{http_server}/datastore.db"
+    checksum = publish(tmp_path, VERSIONS)
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+    monkeypatch.setenv(api.DATASTORE_FILE_ENV, dbfile.as_posix())
+    # Like main(), before starting the workers.
+    datasync.sync_datastore(url, dbfile, src=dbfile)
+    assert datasync.published_checksum(dbfile) == checksum
+
+    app = Flask(__name__)
+    app.config.update(
+        {
+            "db": api.connect_datastore(dbfile),
+            "db_file": dbfile,
+            "db_checksum": datasync.published_checksum(dbfile),
+            "db_hold": datasync.hold_datastore(dbfile),
+        }
+    )
+    assert not api.reload_datastore(app, url)
+
+    releases = [dict(VERSIONS, **{f"202{i}0101-0": COUNTRIES}) for i in (1, 2, 3)]
+    checksums = []
+    for versions in releases:
+        checksums.append(publish(tmp_path, versions))
+        assert api.reload_datastore(app, url)
+        assert app.config["db_checksum"] == checksums[-1]
+        if len(checksums) == 2:
+            # Another worker still serves this release.
+            other = datasync.hold_datastore(app.config["db_file"])
+
+    # The configured datastore is kept, and the replaced ones are removed
+    #  once no worker serves them.
+    assert sorted(f.name for f in dbfile.parent.glob("*.db")) == sorted(
+        [dbfile.name] + [f"datastore-{c[:16]}.db" for c in checksums[1:]]
+    )
+    other.close()
+    checksum = publish(tmp_path, dict(VERSIONS, **{"20240101-0": COUNTRIES}))
+    assert api.reload_datastore(app, url)
+    assert sorted(f.name for f in dbfile.parent.glob("*.db")) == sorted(
+        [dbfile.name, f"datastore-{checksum[:16]}.db"]
+    )
+    app.config["db_hold"].close()
+
+
+def test_reload_datastore_bad_checksum(app, tmp_path, http_server, monkeypatch):
+    make_datastore(tmp_path / "datastore.db")
+    (tmp_path / "datastore.db.sha256").write_text("0" * 64)
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+    monkeypatch.setenv(api.DATASTORE_FILE_ENV, dbfile.as_posix())
+    engine = app.config["db"]
+
+    with pytest.raises(ValueError):
+        api.reload_datastore(app, f"{http_server}/datastore.db")
+    assert app.config["db"] is engine
+    assert not list(dbfile.parent.glob("*.db")) + list(dbfile.parent.glob("*.tmp"))
+
+
+COUNTRY_URL = "https://w3id.org/italia/controlled-vocabulary/countries/"
+
+
+def test_resolve_uri_index(datastore):
+    assert resolve_uri(datastore, COUNTRY_URL + "ESP") == [
+        {"vocabulary": "countries", "version": "20200630-0", "key": "ESP"}
+    ]
+    assert [r["version"] for r in resolve_uri(datastore, COUNTRY_URL + "ITA")] == [
+        "20190101-0",
+        "20200630-0",
+    ]
+    assert resolve_uri(datastore, COUNTRY_URL + "XXX") == []
+
+
+def test_index_command(tmp_path):
+    dpath = tmp_path / "datastore.db"
+    df_to_sqlite(
+        pd.DataFrame([{"key": "ITA", "url": COUNTRY_URL + "ITA"}]).set_index("key"),
+        dpath,
+        name="countries",
+        version="20200630-0",
+    )
+    subprocess.run(
+        [sys.executable, "datasync.py", "index", dpath.as_posix()],
+        cwd=Path(__file__).parent.parent / "openapi",
+        check=True,
+    )
+    assert resolve_uri(dpath, COUNTRY_URL + "ITA") == [
+        {"vocabulary": "countries", "version": "20200630-0", "key": "ITA"}
+    ]
+
+
+def test_resolve_uri(app):
+    base_url = "http://localhost/vocabularies/v1/vocabularies-resolve"
+    with app.test_request_context(base_url):
+        ret, status, headers = api.resolve_uri(COUNTRY_URL + "ITA")
+        response = api.resolve_uri(COUNTRY_URL + "FRA", redirect=True)
+        with pytest.raises(api.NotFound):
+            api.resolve_uri(COUNTRY_URL + "XXX")
+
+    assert ret["vocabulary"] == "countries"
+    assert ret["version"] == "20200630-0"
+    assert ret["entry"]["label_en"] == "Italy"
+    assert ret["href"] == "http://localhost/vocabularies/v1/vocabularies/countries/ITA"
+    assert headers["cache-control"] == api.CACHE_CONTROL_LATEST
+    assert response.status_code == 303
+    assert response.headers["Location"].endswith("/vocabularies/countries/FRA")
+
+
+def test_sync_datastore(tmp_path, http_server):
+    published = make_datastore(tmp_path / "datastore.db")
+    datasync.publish_tables(published)
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+    url = f"{http_server}/datastore.db"
+
+    assert datasync.sync_datastore(url, dbfile, src=dbfile) == {
+        "copied": 0,
+        "downloaded": len(VERSIONS),
+    }
+    # An up to date datastore is not rebuilt.
+    mtime = dbfile.stat().st_mtime_ns
+    assert datasync.sync_datastore(url, dbfile, src=dbfile) == {
+        "copied": 0,
+        "downloaded": 0,
+    }
+    assert dbfile.stat().st_mtime_ns == mtime
+
+    # Publish a new version: only its tables are downloaded.
+    published.unlink()
+    make_datastore(published, dict(VERSIONS, **{"20210101-0": COUNTRIES}))
+    manifest = datasync.publish_tables(published)
+    assert datasync.sync_datastore(url, dbfile, src=dbfile) == {
+        "copied": len(VERSIONS),
+        "downloaded": 1,
+    }
+
+    db = sqlite3.connect(dbfile)
+    assert {
+        table: datasync.table_checksum(db, table) for table in datasync.list_tables(db)
+    } == {table: entry["sha256"] for table, entry in manifest["tables"].items()}
+    assert db.execute(
+        """SELECT name FROM sqlite_master WHERE type = 'index'
+        AND tbl_name = 'countries#20210101-0'"""
+    ).fetchall()
+    db.close()
+    assert len(resolve_uri(dbfile, COUNTRY_URL + "ITA")) == len(VERSIONS) + 1
+    assert not list(dbfile.parent.glob("*.tmp"))
+
+
+def test_sync_datastore_bad_checksum(tmp_path, http_server):
+    published = make_datastore(tmp_path / "datastore.db")
+    manifest = datasync.publish_tables(published)
+    table = next(iter(manifest["tables"]))
+    manifest["tables"][table]["sha256"] = "0" * 64
+    datasync.manifest_path(published).write_text(json.dumps(manifest))
+    dbfile = tmp_path / "local" / "datastore.db"
+    dbfile.parent.mkdir()
+
+    with pytest.raises(ValueError):
+        datasync.sync_datastore(f"{http_server}/datastore.db", dbfile)
+    assert not list(dbfile.parent.iterdir())
+
+
+def test_metrics(app):
+    metrics.init_app(app)
+    app.add_url_rule(
+        "/vocabularies/<vocabulary_id>/<entry_id>", view_func=api.get_entry
+    )
+    labels = {
+        "route": "/vocabularies/<vocabulary_id>/<entry_id>",
+        "method": "GET",
+        "status": "200",
+    }
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    count = sample("ndc_api_requests_total", **labels)
+    queries = sample("ndc_api_query_duration_seconds_count", statement="SELECT")
+    client = app.test_client()
+    assert client.get("/vocabularies/countries/ITA").status_code == 200
+    assert client.get("/vocabularies/countries/XXX").status_code == 404
+
+    assert sample("ndc_api_requests_total", **labels) == count + 1
+    assert sample("ndc_api_request_duration_seconds_count", route=labels["route"])
+    assert sample("ndc_api_query_duration_seconds_count", statement="SELECT") > queries
+    assert sample("ndc_api_cache_requests_total", cache="catalog", result="miss")
+
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.mimetype == "text/plain"
+    assert 'ndc_api_requests_total{method="GET"' in res.get_data(as_text=True)
+
+
+def test_metrics_worker_exit(datastore, tmp_path):
+    # The multiprocess mode is selected when prometheus_client is imported.
+    worker = f"""
+import metrics
+from flask import Flask
+metrics.init_app(Flask(__name__))
+metrics.observe_datastore({datastore.as_posix()!r}, {{}})
+metrics.observe_cache("catalog", True)
+"""
+    subprocess.run(
+        [sys.executable, "-c", worker],
+        cwd=Path(__file__).parent.parent / "openapi",
+        env=dict(os.environ, **{metrics.MULTIPROC_DIR_ENV: tmp_path.as_posix()}),
+        check=True,
+    )
+    files = sorted(f.name.split("_")[0] for f in tmp_path.iterdir())
+    assert files == ["counter"]
+
+
+def test_get_entry_jsonld(app):
+    jsonifier = snapshot.Jsonifier(snapshot.flask.json, indent=2)
+    with app.test_request_context("/vocabularies/countries/ITA"):
+        entry, _, _ = api.get_entry("countries", "ITA")
+        expected = jsonifier.dumps(dict(entry, **{"@context": CONTEXT}))
+    with app.test_request_context(
+        "/vocabularies/countries/ITA", headers={"Accept": "application/ld+json"}
+    ):
+        response = api.get_entry("countries", "ITA")
+
+    assert response.mimetype == "application/ld+json"
+    assert response.get_data(as_text=True) == expected
+
+
+PLACES = {
+    # key: (label, parent)
+    "ITA": ("Italia", None),
+    "LAZ": ("Lazio", "ITA"),
+    "LOM": ("Lombardia", "ITA"),
+    "RM": ("Roma", "LAZ"),
+    "MI": ("Milano", "LOM"),
+    "FCO": ("Fiumicino", "RM"),
+}
+
+
+@pytest.fixture(scope="module")
+def hierarchy_app(tmp_path_factory):
+    ns = "https://w3id.org/italia/controlled-vocabulary/places/"
+    df = pd.DataFrame(
+        [{"key": k, "url": ns + k, "label_it": v[0]} for k, v in PLACES.items()]
+    ).set_index("key")
+    g = Graph()
+    for key, (_, parent) in PLACES.items():
+        if parent:
+            g.add((URIRef(ns + key), SKOS.broader, URIRef(ns + parent)))
+
+    dpath = tmp_path_factory.mktemp("hierarchy") / "datastore.db"
+    df_to_sqlite(
+        df,
+        dpath,
+        name="places",
+        version="1.0.0",
+        context=CONTEXT,
+        closure=hierarchy_closure(g, dict(zip(df["url"], df.index))),
+    )
+    app = Flask(__name__)
+    app.config["db"] = api.connect_datastore(dpath)
+    app.teardown_appcontext(api.close_db)
+    return app
+
+
+def test_get_children(hierarchy_app):
+    with hierarchy_app.test_request_context("/vocabularies/places/ITA/children"):
+        ret, status, headers = api.get_children("places", "ITA")
+        leaf, *_ = api.get_children("places", "FCO")
+
+    assert [(e["key"], e["depth"]) for e in ret["entries"]] == [
+        ("LAZ", 1),
+        ("LOM", 1),
+    ]
+    assert ret["count"] == 2
+    assert ret["version"] == "1.0.0"
+    assert leaf["entries"] == []
+
+
+def test_get_ancestors(hierarchy_app):
+    with hierarchy_app.test_request_context("/vocabularies/places/FCO/ancestors"):
+        ret, *_ = api.get_ancestors("places", "FCO")
+
+    assert [(e["key"], e["depth"]) for e in ret["entries"]] == [
+        ("RM", 1),
+        ("LAZ", 2),
+        ("ITA", 3),
+    ]
+
+
+def test_get_descendants(hierarchy_app):
+    with hierarchy_app.test_request_context("/vocabularies/places/ITA/descendants"):
+        ret, *_ = api.get_descendants("places", "ITA")
+        shallow, *_ = api.get_descendants("places", "ITA", max_depth=2)
+        with pytest.raises(api.NotFound):
+            api.get_descendants("places", "XXX")
+
+    assert [e["key"] for e in ret["entries"]] == ["LAZ", "LOM", "MI", "RM", "FCO"]
+    assert [e["key"] for e in shallow["entries"]] == ["LAZ", "LOM", "MI", "RM"]
+
+
+def test_get_ancestors_without_closure(app):
+    with app.test_request_context("/vocabularies/countries/ITA/ancestors"):
+        ret, *_ = api.get_ancestors("countries", "ITA")
+        with pytest.raises(api.NotFound):
+            api.get_ancestors("countries", "XXX")
+    assert ret["entries"] == []
+
+
+def test_rebuild_without_closure(tmp_path):
+    dpath = tmp_path / "datastore.db"
+    df = pd.DataFrame([{"key": "ITA", "label_it": "Italia"}]).set_index("key")
+    closure = pd.DataFrame(
+        [("ITA", "ITA", 0)], columns=["ancestor", "descendant", "depth"]
+    )
+    df_to_sqlite(df, dpath, name="places", version="1.0.0", closure=closure)
+    # The hierarchy was removed from the vocabulary.
+    df_to_sqlite(df, dpath, name="places", version="1.0.0", closure=closure[:0])
+
+    app = Flask(__name__)
+    app.config["db"] = api.connect_datastore(dpath)
+    with app.app_context():
+        assert api.get_version("places")["closure"] is None
+
+
+def test_prefix_index():
+    assert autocomplete.normalize(" Forlì-Cesena ") == "forli cesena"
+    index = autocomplete.PrefixIndex(
+        [
+            ("RE", None, "label_it", "Reggio nell'Emilia"),
+            ("RC", None, "label_it", "Reggio di Calabria"),
+            ("EM", None, "label_it", "Emilia-Romagna"),
+            ("EM", None, "label_en", "Emilia-Romagna"),
+            ("XX", None, "label_en", None),
+        ]
+    )
+    assert len(index) == 4
+
+    def keys(prefix, **kwargs):
+        return [e["key"] for e in index.search(prefix, **kwargs)]
+
+    assert keys("reggio") == ["RC", "RE"]
+    assert keys("reggio", limit=1) == ["RC"]
+    # Whole-label matches come first, and entries are not repeated.
+    assert keys("emil") == ["EM", "RE"]
+    assert keys("EMILIA ROM") == ["EM"]
+    assert keys("emil", fields=["label_en"]) == ["EM"]
+    assert keys("") == keys("xyz") == []
+
+
+def test_autocomplete(app):
+    with app.test_request_context("/vocabularies-autocomplete/countries"):
+        ret, status, headers = api.autocomplete("countries", "a")
+        it, *_ = api.autocomplete("countries", "germ", lang="it")
+        old, *_ = api.autocomplete("countries", "spa", version="20190101-0")
+
+    assert [(e["key"], e["label"]) for e in ret["entries"]] == [("AUT", "Austria")]
+    assert ret["entries"][0]["url"] == COUNTRY_URL + "AUT"
+    assert headers["cache-control"] == api.CACHE_CONTROL_LATEST
+    assert [(e["key"], e["field"]) for e in it["entries"]] == [("DEU", "label_it")]
+    assert old["entries"] == []
+
+
+def test_autocomplete_response(client):
+    res = client.get("/vocabularies/v1/vocabularies-autocomplete/countries?q=a")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/json"
+    assert res.json()["entries"][0]["key"] == "AUT"
+
+
+def test_resolve_uri_response(client):
+    url = "/vocabularies/v1/vocabularies-resolve"
+    res = client.get(url, params={"uri": COUNTRY_URL + "ITA"})
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/json"
+    assert res.json()["entry"]["key"] == "ITA"
+
+    res = client.get(
+        url,
+        params={"uri": COUNTRY_URL + "ITA", "redirect": "true"},
+        follow_redirects=False,
+    )
+    assert res.status_code == 303
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from rdflib import Graph
+
+from dati_playground import daemon
+from dati_playground.validators import validate_files
+from dati_playground.validators.context import ValidationContext
+
+TURTLE = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<https://w3id.org/italia/controlled-vocabulary/countries> a skos:ConceptScheme .
+"""
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    # serve() shares the parsed graphs among all the contexts.
+    monkeypatch.setattr(ValidationContext, "graphs", None)
+    socket_path = tmp_path / "daemon" / "validation.sock"
+    thread = threading.Thread(
+        target=daemon.serve, args=(socket_path,), kwargs={"idle_timeout": 1}
+    )
+    thread.start()
+    while not socket_path.exists():
+        thread.join(0.1)
+    yield socket_path
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not socket_path.exists()
+
+
+def test_forward(tmp_path, monkeypatch, socket_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "countries.ttl").write_text(TURTLE)
+    (tmp_path / "broken.ttl").write_text("not turtle")
+    files = ["broken.ttl", "countries.ttl"]
+    parsed = []
+    parse = Graph.parse
+    monkeypatch.setattr(
+        Graph, "parse", lambda g, *a, **kw: parsed.append(1) or parse(g, *a, **kw)
+    )
+
+    results = daemon.forward(files, ["turtle"], None, socket_path)
+    assert results == validate_files(files, ["turtle"])
+    assert [len(errors) for errors in results] == [1, 0]
+
+    # Graphs are parsed again only when their file changes.
+    parsed.clear()
+    assert daemon.forward(files, ["turtle"], None, socket_path) == results
+    assert len(parsed) == 1
+    (tmp_path / "broken.ttl").write_text(TURTLE)
+    assert daemon.forward(files, ["turtle"], None, socket_path) == [[], []]
+
+    assert daemon.forward(files, None, None, socket_path) == validate_files(files, None)
+
+
+def test_forward_workers(tmp_path, monkeypatch, socket_path):
+    monkeypatch.chdir(tmp_path)
+    files = []
+    for name in ("a.ttl", "b.ttl", "broken.ttl"):
+        (tmp_path / name).write_text("not turtle" if name == "broken.ttl" else TURTLE)
+        files.append(name)
+    workers = []
+    run = daemon.validate_files
+    monkeypatch.setattr(
+        daemon,
+        "validate_files",
+        lambda *args: workers.append(args[3]) or run(*args),
+    )
+
+    results = daemon.forward(files, ["turtle"], None, socket_path, workers=2)
+    assert results == validate_files(files, ["turtle"])
+    assert workers == [2]
+
+
+def test_forward_without_daemon(tmp_path):
+    socket_path = tmp_path / "validation.sock"
+    assert daemon.forward(["a.ttl"], ["turtle"], None, socket_path) is None
+    socket_path.touch()
+    assert daemon.forward(["a.ttl"], ["turtle"], None, socket_path) is None
+
+
+def test_graph_cache():
+    graphs = daemon.GraphCache(maxsize=2)
+    graphs["a"], graphs["b"] = 1, 2
+    assert graphs["a"] == 1
+    graphs["c"] = 3
+    assert list(graphs) == ["a", "c"]
@@ -6,12 +6,15 @@ from pathlib import Path
 import pandas as pd
 import pytest
 from pyld import jsonld
+from rdflib import URIRef
 from rdflib.graph import Graph
+from rdflib.namespace import SKOS
 
 from dati_playground.framing import (
     frame_components,
     frame_vocabulary,
     frame_vocabulary_to_csv,
+    hierarchy_closure,
 )
 from dati_playground.utils import MIME_JSONLD, MIME_TURTLE, yaml_load
 
@@ -49,6 +52,28 @@ def test_vocabulary_csv():
     )
 
 
+def test_hierarchy_closure():
+    ns = "https://w3id.org/italia/controlled-vocabulary/places/"
+    g = Graph()
+    g.add((URIRef(ns + "RM"), SKOS.broader, URIRef(ns + "LAZ")))
+    g.add((URIRef(ns + "LAZ"), SKOS.broader, URIRef(ns + "ITA")))
+    # Narrower links are reversed, and repeated links are ignored.
+    g.add((URIRef(ns + "ITA"), SKOS.narrower, URIRef(ns + "LOM")))
+    g.add((URIRef(ns + "LOM"), SKOS.broader, URIRef(ns + "ITA")))
+    # Entries outside the vocabulary are ignored.
+    g.add((URIRef(ns + "ITA"), SKOS.broader, URIRef("https://example.org/EU")))
+    # Cycles terminate.
+    g.add((URIRef(ns + "ITA"), SKOS.broader, URIRef(ns + "RM")))
+
+    keys = {ns + k: k for k in ("ITA", "LAZ", "RM", "LOM")}
+    closure = hierarchy_closure(g, keys)
+    rows = set(closure.itertuples(index=False, name=None))
+    assert {("LAZ", "RM", 1), ("ITA", "RM", 2), ("ITA", "LOM", 1)} <= rows
+    assert ("RM", "ITA", 1) in rows
+    assert all(a != d for a, d, _ in rows)
+    assert len(rows) == len(closure)
+
+
 def walk_path(base: Path, pattern: str):
     for root, dir, files in os.walk(base):
         for f in files:
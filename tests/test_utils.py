@@ -2,7 +2,7 @@ from pathlib import Path
 
 from rdflib import URIRef
 
-from dati_playground.utils import load_all_assets
+from dati_playground.utils import load_all_assets, version_key
 
 
 def test_load_all_assets():
@@ -10,3 +10,14 @@ def test_load_all_assets():
     assert list(
         g.triples((URIRef("https://w3id.org/italia/onto/CPV/Person"), None, None))
     )
+
+
+def test_version_key():
+    versions = ["1.10.0", "1.9.0", "20200630-0", "0.0.7", "20200630-10"]
+    assert sorted(versions, key=version_key) == [
+        "0.0.7",
+        "1.9.0",
+        "1.10.0",
+        "20200630-0",
+        "20200630-10",
+    ]
@@ -0,0 +1,410 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+from click.testing import CliRunner
+from rdflib import Graph
+
+from dati_playground.__main__ import main
+from dati_playground.validators import (
+    HOOKS,
+    applicable_hooks,
+    batched,
+    directory_versioning_pattern,
+    filename_match_uri,
+    get_validator,
+    json_schema,
+    mandatory_files_presence,
+    shacl,
+    turtle,
+    utf8_file_encoding,
+    validate_batch,
+    validate_file,
+    validate_path,
+    versioned_directory,
+)
+from dati_playground.validators.cache import CACHE_FILE_ENV, ValidationCache
+from dati_playground.validators.context import ValidationContext
+
+TURTLE = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<https://w3id.org/italia/controlled-vocabulary/countries> a skos:ConceptScheme .
+<https://w3id.org/italia/controlled-vocabulary/countries/ITA> a skos:Concept ;
+  skos:inScheme <https://w3id.org/italia/controlled-vocabulary/countries> .
+"""
+
+
+@pytest.fixture
+def read_bytes(monkeypatch):
+    """Count the files read by the validators."""
+    calls = []
+    original = Path.read_bytes
+
+    def counting_read_bytes(self):
+        calls.append(self)
+        return original(self)
+
+    monkeypatch.setattr(Path, "read_bytes", counting_read_bytes)
+    return calls
+
+
+def test_context_shared_by_validators(tmp_path, read_bytes):
+    fpath = tmp_path / "countries.ttl"
+    fpath.write_text(TURTLE)
+    context = ValidationContext(fpath)
+    errors = []
+
+    assert turtle.validate(fpath, errors, context)
+    assert filename_match_uri.validate(fpath, errors, context)
+    assert utf8_file_encoding.validate(fpath, errors, context)
+    assert shacl.validate(fpath, errors, context)
+    assert not errors
+    assert read_bytes == [fpath]
+    assert context.graph is context.graph
+
+
+def test_context_errors_are_computed_once(tmp_path, read_bytes):
+    fpath = tmp_path / "broken.yaml"
+    fpath.write_bytes(b"type: object\nfoo: [\xe8")
+    context = ValidationContext(fpath)
+    errors = []
+
+    assert not utf8_file_encoding.validate(fpath, errors, context)
+    assert not json_schema.validate(fpath, errors, context)
+    with pytest.raises(UnicodeDecodeError):
+        context.yaml
+    assert len(errors) == 2
+    assert read_bytes == [fpath]
+
+
+def test_context_universal_newlines(tmp_path):
+    fpath = tmp_path / "schema.yaml"
+    fpath.write_bytes(b"type: object\r\ntitle: foo\r\n")
+    context = ValidationContext(fpath)
+    assert context.text == fpath.read_text()
+    assert context.yaml == {"type": "object", "title": "foo"}
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    cache_file = tmp_path / "cache" / "validation.sqlite"
+    monkeypatch.setenv(CACHE_FILE_ENV, cache_file.as_posix())
+    return cache_file
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_sorted_errors(tmp_path, cache_file, workers):
+    files = []
+    for name in ("c.ttl", "a.ttl", "b.ttl", "ok.ttl"):
+        files.append(tmp_path / name)
+        files[-1].write_text(TURTLE if name == "ok.ttl" else "not turtle")
+
+    result = CliRunner().invoke(
+        main,
+        [
+            "validate",
+            *map(str, files),
+            "--validate-turtle=true",
+            "--validate-utf8-file-encoding=true",
+            f"--workers={workers}",
+        ],
+    )
+    assert result.exit_code == 1
+    errors = [line for line in result.output.splitlines() if line.startswith("ERROR")]
+    assert [e.split()[1].split("/")[-1] for e in errors] == ["a.ttl", "b.ttl", "c.ttl"]
+
+
+def test_validate_path_deduplicates(tmp_path):
+    fpath = tmp_path / "a.ttl"
+    fpath.write_text("not turtle")
+    assert len(validate_path(fpath, [turtle.validate, turtle.validate])) == 1
+
+
+def test_validation_cache(tmp_path, monkeypatch):
+    fpath = tmp_path / "countries.ttl"
+    fpath.write_text(TURTLE)
+    broken = tmp_path / "broken.ttl"
+    broken.write_text("not turtle")
+    cache = ValidationCache(tmp_path / "validation.sqlite")
+    validators = [turtle.validate, filename_match_uri.validate]
+
+    assert validate_path(fpath, validators, cache) == []
+    assert len(validate_path(broken, validators, cache)) == 2
+
+    parsed = []
+    monkeypatch.setattr(Graph, "parse", lambda g, *a, **kw: parsed.append(kw))
+    # Only the turtle validation is cached, as filename_match_uri depends on the path.
+    assert validate_path(fpath, [turtle.validate], cache) == []
+    assert not parsed
+    validate_path(fpath, validators, cache)
+    assert len(parsed) == 1
+    # Failed validations are not cached.
+    validate_path(broken, [turtle.validate], cache)
+    assert len(parsed) == 2
+
+
+def test_validation_cache_key(tmp_path):
+    fpath = tmp_path / "vocabulary" / "countries.ttl"
+    fpath.parent.mkdir()
+    fpath.write_text(TURTLE)
+
+    def key():
+        return ValidationCache.key(shacl.validate, fpath, ValidationContext(fpath))
+
+    without_rules = key()
+    rules = tmp_path / "rules.shacl"
+    rules.write_text("")
+    with_rules = key()
+    rules.write_text("# Changed rules.")
+    assert len({without_rules, with_rules, key()}) == 3
+    assert (
+        ValidationCache.key(
+            filename_match_uri.validate, fpath, ValidationContext(fpath)
+        )
+        is None
+    )
+    context = ValidationContext(fpath)
+    assert ValidationCache.key(turtle.validate, fpath, context) != (
+        ValidationCache.key(turtle.validate_syntax, fpath, context)
+    )
+
+
+def test_validation_cache_streamed(tmp_path, read_bytes):
+    fpath = tmp_path / "countries.ttl"
+    fpath.write_text(TURTLE)
+    cache = ValidationCache(tmp_path / "validation.sqlite")
+
+    assert validate_path(fpath, [turtle.validate_syntax], cache) == []
+    assert validate_path(fpath, [turtle.validate_syntax], cache) == []
+    assert not read_bytes
+    # The same digest is computed from the content read by other validators.
+    loaded = ValidationContext(fpath)
+    assert loaded.content
+    assert loaded.digest == ValidationContext(fpath).digest
+
+
+def test_validate_no_cache(tmp_path, cache_file):
+    fpath = tmp_path / "countries.ttl"
+    fpath.write_text(TURTLE)
+    args = ["validate", fpath.as_posix(), "--validate-turtle=true", "--workers=1"]
+
+    assert CliRunner().invoke(main, [*args, "--no-cache"]).exit_code == 0
+    assert not cache_file.exists()
+    assert CliRunner().invoke(main, args).exit_code == 0
+    assert cache_file.exists()
+
+
+RULES = """@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<#ConceptShape> a sh:NodeShape ;
+  sh:targetClass skos:Concept ;
+  sh:property [ sh:path skos:prefLabel ; sh:minCount 1 ] .
+"""
+
+
+def test_shacl_batch(tmp_path):
+    (tmp_path / "rules.shacl").write_text(RULES)
+    files = []
+    for name in ("a", "b", "c"):
+        files.append(tmp_path / name / f"{name}.ttl")
+        files[-1].parent.mkdir()
+        files[-1].write_text(TURTLE if name == "b" else "")
+    shacl.get_shacl_graph.cache_clear()
+
+    results = validate_batch(files, [shacl.validate])
+    assert [len(errors) for errors in results] == [0, 1, 0]
+    assert "b.ttl" in results[1][0]
+    assert shacl.get_shacl_graph.cache_info().misses == 1
+
+    context = ValidationContext(files[1])
+    triples = len(context.graph)
+    assert not shacl.validate(files[1], [], context)
+    assert len(context.graph) == triples
+
+
+def test_group_by_rules(tmp_path):
+    (tmp_path / "rules.shacl").write_text(RULES)
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "rules.shacl").write_text(RULES)
+    files = [tmp_path / "a.ttl", tmp_path / "other" / "b.ttl", tmp_path / "c.ttl"]
+
+    groups = shacl.group_by_rules(files)
+    assert groups == {
+        (tmp_path / "rules.shacl").absolute(): [files[0], files[2]],
+        (tmp_path / "other" / "rules.shacl").absolute(): [files[1]],
+    }
+    assert batched(groups.values(), 1) == [[files[0]], [files[2]], [files[1]]]
+
+
+def test_tree_snapshot(tmp_path, monkeypatch):
+    for version in ("v1.0", "2", "latest"):
+        (tmp_path / "vocabulary" / version).mkdir(parents=True)
+        for name in ("vocabulary.ttl", "vocabulary.csv"):
+            (tmp_path / "vocabulary" / version / name).write_text(TURTLE)
+    files = sorted(tmp_path.glob("vocabulary/*/*"))
+    scanned, checked = [], []
+    scandir, check_directory = os.scandir, directory_versioning_pattern.check_directory
+    monkeypatch.setattr(os, "scandir", lambda p: scanned.append(p) or scandir(p))
+    monkeypatch.setattr(
+        directory_versioning_pattern,
+        "check_directory",
+        lambda tree, d: checked.append(d) or check_directory(tree, d),
+    )
+
+    results = validate_batch(
+        files,
+        [
+            directory_versioning_pattern.validate,
+            mandatory_files_presence.validate,
+            versioned_directory.validate,
+        ],
+    )
+    assert len(scanned) == len(set(scanned))
+    assert sorted(checked) == sorted({f.parent for f in files})
+    for fpath, errors in zip(files, results):
+        if fpath.parent.name == "latest":
+            assert not any("versioning pattern" in e for e in errors)
+        else:
+            assert len(errors) == 1
+            assert errors[0].startswith(
+                f"Inconsistent versioning pattern found for {fpath.parent}:"
+            )
+
+
+def test_hooks_match_pre_commit_hooks():
+    hooks_yaml = Path(__file__).parent.parent / ".pre-commit-hooks.yaml"
+    hooks = {
+        hook["id"]: (hook["files"], hook.get("exclude"))
+        for hook in yaml.safe_load(hooks_yaml.read_text())
+        if hook["id"] != "validate-all"
+    }
+    assert hooks == {
+        hook: (files, exclude) for hook, (_, files, exclude) in HOOKS.items()
+    }
+
+
+def test_validate_all(tmp_path, monkeypatch, cache_file):
+    monkeypatch.chdir(tmp_path)
+    vocabulary = Path("assets", "vocabularies", "countries", "latest")
+    vocabulary.mkdir(parents=True)
+    (vocabulary / "countries.ttl").write_text(TURTLE)
+    (vocabulary / "countries-example.ttl").write_bytes(b"not turtle \xe8")
+
+    assert applicable_hooks(vocabulary / "countries.ttl")[0] == "validate-turtle"
+    assert "validate-turtle" not in applicable_hooks(
+        (vocabulary / "countries-example.ttl").absolute()
+    )
+
+    result = CliRunner().invoke(
+        main, ["validate", *map(str, vocabulary.iterdir()), "--all", "--workers=1"]
+    )
+    assert result.exit_code == 1
+    report = dict(
+        line.split(": ", 1)
+        for line in result.output.splitlines()
+        if line.startswith("validate-")
+    )
+    assert report["validate-turtle"] == "Passed (files: 1)"
+    assert report["validate-utf8-file-encoding"] == "Failed (files: 2)"
+    assert report["validate-csv"] == "Skipped (no files to check)"
+
+
+def test_cli_imports_are_lazy():
+    # Heavy libraries are only imported by the commands using them.
+    heavy = ("pandas", "pyshacl", "frictionless", "requests_cache", "pyld", "rdflib")
+    code = (
+        "import sys\n"
+        "import dati_playground.__main__\n"
+        "from dati_playground.validators import get_validator\n"
+        "get_validator('filename_format')\n"
+        f"print([m for m in {heavy!r} if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_versioned_directory_compare_graphs(tmp_path):
+    vocabulary = tmp_path / "countries"
+    for version in ("v1", "latest"):
+        (vocabulary / version).mkdir(parents=True)
+    (vocabulary / "v1" / "countries.ttl").write_text(
+        TURTLE
+        + "<#ITA> skos:note [ skos:note [ a skos:Concept ] ], [ a skos:Concept ] ."
+    )
+    latest = vocabulary / "latest" / "countries.ttl"
+    # The same triples in another order, with other blank node ids.
+    latest.write_text(
+        """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix countries: <https://w3id.org/italia/controlled-vocabulary/countries/> .
+<#ITA> skos:note _:b0, _:b1 .
+_:b0 a skos:Concept .
+_:b1 skos:note [ a skos:Concept ] .
+countries:ITA skos:inScheme <https://w3id.org/italia/controlled-vocabulary/countries> ;
+  a skos:Concept .
+<https://w3id.org/italia/controlled-vocabulary/countries> a skos:ConceptScheme .
+"""
+    )
+    versioned_directory.canonical_hash.cache_clear()
+
+    errors = []
+    assert not versioned_directory.validate(latest, errors)
+    assert errors[0].startswith("files are different")
+    assert (
+        validate_path(latest, [get_validator("versioned_directory:validate_graphs")])
+        == []
+    )
+    assert versioned_directory.canonical_hash.cache_info().misses == 2
+
+    latest.write_text(TURTLE.replace("ITA", "FRA"))
+    errors = []
+    assert not versioned_directory.validate_graphs(latest, errors)
+    assert errors[0].startswith("files are different")
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1 << 20])
+def test_turtle_check_syntax(tmp_path, chunk_size):
+    fpath = tmp_path / "countries.ttl"
+    # Dots followed by spaces in literals do not end the statements.
+    fpath.write_text(
+        TURTLE + '<#ITA> skos:note """ends. \n with a dot. """, "Ita. lia"@it .\n' * 50
+    )
+    turtle.check_syntax(fpath, chunk_size)
+
+    # Comments containing ". " are not cut, whatever the chunk size.
+    fpath.write_text(
+        TURTLE
+        + "<#ITA> a skos:Concept . # One. Two.\n<#FRA> # Three. Four\n a skos:Concept .\n"
+    )
+    for size in range(1, 60):
+        turtle.check_syntax(fpath, size)
+
+    fpath.write_text(TURTLE + "\n<#ITA> skos:prefLabel\n  %%% .\n" + TURTLE)
+    with pytest.raises(turtle.TurtleSyntaxError) as e:
+        turtle.check_syntax(fpath, chunk_size)
+    # rdflib reports the error where the objects should start.
+    assert (e.value.line, e.value.column) == (6, 22)
+    assert "objectList expected" in str(e.value)
+
+    fpath.write_text(TURTLE + '<#ITA> skos:note """unterminated .\n')
+    errors = []
+    assert not turtle.validate_syntax(fpath, errors)
+    assert not turtle.validate(fpath, [])
+    assert errors[0].startswith(f"{fpath} is not a valid Turtle file:")
+
+
+def test_validate_file_turtle_size(tmp_path, monkeypatch):
+    fpath = tmp_path / "countries.ttl"
+    fpath.write_text(TURTLE)
+    monkeypatch.setattr(turtle, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(Graph, "parse", None)
+    assert validate_file(fpath)
+    fpath.write_text(TURTLE + "# Not capped." * (4 << 20))
+    assert validate_file(fpath)